@@ -1,3 +1,20 @@
 from django.contrib import admin
+from .models import ScanRecord
 
-# Register your models here.
+@admin.register(ScanRecord)
+class ScanRecordAdmin(admin.ModelAdmin):
+    list_display = ['occurred_at', 'event_id', 'gate', 'device', 'action', 'outcome', 'latency_ms', 'scanned_by']
+    list_filter = ['outcome', 'action', 'gate']
+    search_fields = ['gate', 'device']
+    date_hierarchy = 'occurred_at'
+    list_select_related = ['scanned_by']
+    
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
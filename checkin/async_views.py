@@ -0,0 +1,165 @@
+"""Async versions of the scanner endpoints, routed in place of the sync views under ASGI
+
+Each view subclasses its sync counterpart and only replaces the handler, so
+payload parsing, response shapes and ledger/live side effects stay shared.
+Database access goes through the async ORM and a request waiting on the
+database no longer holds a worker thread. The offline batch endpoint stays
+sync because it needs ``select_for_update`` inside a transaction.
+"""
+import inspect
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.http import JsonResponse
+from django.utils import timezone
+
+from events.models import Event, Registration
+
+from . import ledger, live, roster
+from .attendance import acheck_in
+from .views import (
+    CheckinAPIView, RosterSnapshotAPIView, ScanQRCodeAPIView, check_scanned_registration, elapsed_ms,
+    parse_scan_request, publish_check_in, registration_details, registration_lookup, requested_event_id,
+    roster_query, scan_check_in_response, scan_error, scanner_source,
+)
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for async views: resolves the user with ``request.auser()``"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        # Resolved once so the sync mixins further down never hit the database
+        request.user = user
+        response = super().dispatch(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+async def afind_scanned_registration(data, user):
+    """Async find_scanned_registration()"""
+    payload, event_id, error = parse_scan_request(data)
+    if error:
+        return None, error
+
+    query = roster_query(payload, event_id)
+    registration = await roster.alookup(**query) if query else None
+    if registration is None:
+        try:
+            registration = await Registration.objects.select_related('event').aget(**registration_lookup(payload))
+        except Registration.DoesNotExist:
+            return None, scan_error('Registration not found', 404, 'not_found')
+        if registration.event_id == event_id:
+            await sync_to_async(roster.remember)(registration)
+
+    error = check_scanned_registration(registration, event_id, user)
+    if error:
+        return None, error
+    return registration, None
+
+class AsyncScanQRCodeAPIView(AsyncLoginRequiredMixin, ScanQRCodeAPIView):
+    async def post(self, request):
+        started = time.monotonic()
+        try:
+            data = json.loads(request.body)
+            registration, error = await afind_scanned_registration(data, request.user)
+            action = 'checkin' if data.get('mode') == 'checkin' else 'lookup'
+            source = scanner_source(request, data)
+            if error:
+                ledger.record(action, error.scan_outcome, event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return error
+
+            if action == 'lookup':
+                ledger.record(action, 'found', event_id=registration.event_id, registration_id=registration.pk,
+                              user=request.user, latency_ms=elapsed_ms(started), **source)
+                return JsonResponse(registration_details(registration))
+
+            previous_status = registration.status
+            attended_at = await acheck_in(registration.pk, registration.event_id)
+            checked_in = attended_at is not None
+            if checked_in:
+                publish_check_in(registration, attended_at, previous_status)
+                registration.status = 'attended'
+                registration.attended_at = attended_at
+            elif registration.status != 'attended':
+                # Another gate won the race; report its check-in time
+                await registration.arefresh_from_db(fields=['status', 'attended_at'])
+
+            ledger.record(action, 'checked_in' if checked_in else 'already_checked_in',
+                          event_id=registration.event_id, registration_id=registration.pk,
+                          user=request.user, latency_ms=elapsed_ms(started), **source)
+            return scan_check_in_response(registration, checked_in, previous_status)
+
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+class AsyncCheckinAPIView(AsyncLoginRequiredMixin, CheckinAPIView):
+    async def post(self, request):
+        started = time.monotonic()
+        try:
+            data = json.loads(request.body)
+            registration_id = data.get('registration_id')
+            source = scanner_source(request, data)
+
+            if not registration_id:
+                ledger.record('checkin', 'invalid', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return JsonResponse({'error': 'Registration ID is required'}, status=400)
+
+            registration = await Registration.objects.filter(pk=registration_id).values(
+                'participant_name', 'status', 'event_id', 'event__organizer_id'
+            ).afirst()
+            if registration is None:
+                ledger.record('checkin', 'not_found', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return JsonResponse({'error': 'Registration not found'}, status=404)
+
+            if registration['event__organizer_id'] != request.user.id:
+                ledger.record('checkin', 'unauthorized', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+            attended_at = await acheck_in(registration_id, registration['event_id'])
+            ledger.record('checkin', 'checked_in' if attended_at else 'already_checked_in',
+                          event_id=registration['event_id'], registration_id=int(registration_id),
+                          user=request.user, latency_ms=elapsed_ms(started), **source)
+            if attended_at is None:
+                return JsonResponse({'error': 'Already checked in'}, status=400)
+            live.publish_check_ins(registration['event_id'], [{
+                'registration_id': int(registration_id),
+                'participant_name': registration['participant_name'],
+                'attended_at': attended_at,
+                'previous_status': registration['status'],
+            }])
+
+            return JsonResponse({
+                'success': True,
+                'message': f'{registration["participant_name"]} checked in successfully',
+                'participant_name': registration['participant_name'],
+                'attended_at': attended_at.isoformat(),
+                'previous_status': registration['status'],
+            })
+
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+class AsyncRosterSnapshotAPIView(AsyncLoginRequiredMixin, RosterSnapshotAPIView):
+    async def get(self, request, pk):
+        if not await Event.objects.filter(pk=pk, organizer=request.user).aexists():
+            return JsonResponse({'error': 'Event not found'}, status=404)
+
+        registrations, since, error = self.changed_registrations(request, pk)
+        if error:
+            return error
+
+        version = timezone.now() - self.overlap
+        entries = [self.entry(pk, *row) async for row in registrations]
+        return self.snapshot_response(pk, version, since, entries)
@@ -0,0 +1,69 @@
+"""Check-in writes shared by the check-in API views"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from events import stats
+from events.models import Event, Registration
+
+from . import roster
+
+
+def check_in(registration_id, event_id, attended_at=None):
+    """Mark a registration as attended with one conditional UPDATE.
+
+    Only ``status`` and ``attended_at`` are written, and only if the row is not
+    already attended, so concurrent scans of the same badge check in once.
+    The event's ``attended_count`` moves in the same transaction;
+    ``event_id`` must be the registration's event.
+    Returns the stored ``attended_at`` if this call performed the check-in,
+    otherwise None.
+    """
+    now = timezone.now()
+    attended_at = attended_at or now
+    with transaction.atomic():
+        updated = Registration.objects.filter(pk=registration_id).exclude(status='attended').update(
+            status='attended', attended_at=attended_at, updated_at=now
+        )
+        if not updated:
+            return None
+        Event.objects.filter(pk=event_id).update(attended_count=F('attended_count') + 1)
+        transaction.on_commit(partial(stats.invalidate_event, event_id))
+    roster.record_check_ins({registration_id: attended_at})
+    return attended_at
+
+
+async def acheck_in(registration_id, event_id, attended_at=None):
+    """Async check_in() for the ASGI views.
+
+    Runs the sync version in a thread: the async ORM cannot open the
+    transaction that keeps the registration and counter UPDATEs together.
+    """
+    return await sync_to_async(check_in)(registration_id, event_id, attended_at)
+
+
+def check_in_many(attended_at_by_id):
+    """Check in many registrations with one set-based UPDATE, keeping each row's own timestamp.
+
+    ``attended_at_by_id`` maps registration ids to the time they were scanned.
+    Callers should hold row locks (``select_for_update``) on rows they have
+    already classified, inside the same transaction.
+    """
+    if not attended_at_by_id:
+        return 0
+    attended_at = Case(
+        *[When(pk=pk, then=Value(when)) for pk, when in attended_at_by_id.items()],
+        output_field=DateTimeField(),
+    )
+    pending = Registration.objects.filter(pk__in=list(attended_at_by_id)).exclude(status='attended')
+    with transaction.atomic():
+        per_event = list(pending.order_by().values_list('event_id').annotate(Count('id')))
+        updated = pending.update(status='attended', attended_at=attended_at, updated_at=timezone.now())
+        for event_id, count in per_event:
+            Event.objects.filter(pk=event_id).update(attended_count=F('attended_count') + count)
+            transaction.on_commit(partial(stats.invalidate_event, event_id))
+    roster.record_check_ins(attended_at_by_id)
+    return updated
@@ -0,0 +1,86 @@
+"""Publish/subscribe broker for live check-in updates
+
+``LocalBroker`` keeps subscribers in process memory, so live counters work
+under a single ASGI worker without Redis or any other service. Publishers may
+run in worker threads (sync views); messages are handed to each subscriber's
+event loop with ``call_soon_threadsafe``. Another backend can be plugged in
+through the ``CHECKIN_BROKER`` setting as long as it offers ``publish``,
+``subscribe`` and ``recent``.
+"""
+import asyncio
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Delivered instead of queued messages when a subscriber falls too far behind
+RESYNC = {'type': 'resync'}
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        """Runs on the subscriber's loop; a full queue is replaced by a single resync marker"""
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = RESYNC
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Next message, or None if nothing arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class LocalBroker:
+    def __init__(self, queue_size=100, history=20):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._recent = defaultdict(lambda: deque(maxlen=history))
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Subscribe from inside a running event loop"""
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message, recent=()):
+        """Fan a message out to current subscribers; ``recent`` items are kept for late joiners"""
+        with self._lock:
+            self._recent[channel].extend(recent)
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(subscription)
+
+    def recent(self, channel):
+        with self._lock:
+            return list(self._recent.get(channel, ()))
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'CHECKIN_BROKER', 'checkin.broker.LocalBroker'))()
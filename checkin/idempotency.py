@@ -0,0 +1,123 @@
+"""Idempotency-Key support for the check-in APIs
+
+A client sends ``Idempotency-Key: <opaque string>`` with a POST. The first
+response for that key (per user) is kept in the cache for
+``CHECKIN_IDEMPOTENCY_TIMEOUT`` seconds and replayed verbatim for retries,
+without running the view again. Reusing a key with a different body is
+rejected, and a retry that arrives while the original is still running gets
+409 with ``Retry-After``. Server errors (5xx) are not kept.
+
+Only one request may claim a key, which needs an atomic ``cache.add()``:
+memcached, redis and the database cache provide one, and the local-memory
+cache within its single process. The file-based cache checks and writes in
+two steps, so claims on it are serialized with a lock file in the cache
+directory; that only holds for processes sharing one host and directory.
+"""
+import hashlib
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.http import HttpResponse, JsonResponse
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+IN_PROGRESS = 'in-progress'
+# How long a claimed key blocks retries if its request never finishes
+IN_PROGRESS_TIMEOUT = 30
+
+def _timeout():
+    return getattr(settings, 'CHECKIN_IDEMPOTENCY_TIMEOUT', 10 * 60)
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(f'{request.path}\n{key}'.encode()).hexdigest()
+    return f'checkin:idempotency:{request.user.pk}:{digest}'
+
+def _claim(cache_key, fingerprint):
+    """Mark a key in progress; False if another request holds or finished it"""
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        return cache.add(cache_key, (IN_PROGRESS, fingerprint), timeout=IN_PROGRESS_TIMEOUT)
+    os.makedirs(backend._dir, exist_ok=True)
+    with open(os.path.join(backend._dir, 'idempotency.lock'), 'ab') as f:
+        locks.lock(f, locks.LOCK_EX)
+        try:
+            return cache.add(cache_key, (IN_PROGRESS, fingerprint), timeout=IN_PROGRESS_TIMEOUT)
+        finally:
+            locks.unlock(f)
+
+async def _aclaim(cache_key, fingerprint):
+    if isinstance(caches['default'], FileBasedCache):
+        return await sync_to_async(_claim)(cache_key, fingerprint)
+    return await cache.aadd(cache_key, (IN_PROGRESS, fingerprint), timeout=IN_PROGRESS_TIMEOUT)
+
+class IdempotentMixin:
+    """Replay the stored response of a POST whose Idempotency-Key was seen before.
+
+    Place after LoginRequiredMixin so keys are scoped to the authenticated user.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return super().dispatch(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'{HEADER} is too long'}, status=400)
+        if self.view_is_async:
+            return self.adispatch_once(key, request, *args, **kwargs)
+
+        cache_key = _cache_key(request, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        if not _claim(cache_key, fingerprint):
+            return self.replay(cache.get(cache_key), fingerprint)
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        self.store(cache_key, fingerprint, response)
+        return response
+
+    async def adispatch_once(self, key, request, *args, **kwargs):
+        cache_key = _cache_key(request, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        if not await _aclaim(cache_key, fingerprint):
+            return self.replay(await cache.aget(cache_key), fingerprint)
+
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            await cache.adelete(cache_key)
+            raise
+        await sync_to_async(self.store)(cache_key, fingerprint, response)
+        return response
+
+    def store(self, cache_key, fingerprint, response):
+        if response.status_code >= 500 or response.streaming:
+            cache.delete(cache_key)
+        else:
+            stored = (response.status_code, response['Content-Type'], response.content)
+            cache.set(cache_key, (stored, fingerprint), timeout=_timeout())
+
+    def replay(self, entry, fingerprint):
+        if entry is None:
+            # Expired between add() and get(); let the client retry normally
+            return self.conflict()
+        stored, stored_fingerprint = entry
+        if stored_fingerprint != fingerprint:
+            return JsonResponse({'error': f'{HEADER} was already used for a different request'}, status=422)
+        if stored == IN_PROGRESS:
+            return self.conflict()
+        status, content_type, content = stored
+        response = HttpResponse(content, status=status, content_type=content_type)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def conflict(self):
+        response = JsonResponse({'error': 'A request with this Idempotency-Key is still in progress'}, status=409)
+        response['Retry-After'] = '1'
+        return response
@@ -0,0 +1,116 @@
+"""Buffered writes to the append-only scan ledger
+
+Check-in views call ``record()``, which only appends an unsaved ScanRecord to
+an in-process buffer. The buffer is written with one ``bulk_create`` once it
+holds ``CHECKIN_LEDGER_BATCH_SIZE`` entries or its oldest entry is older than
+``CHECKIN_LEDGER_FLUSH_INTERVAL`` seconds. Flushes run from the
+``request_finished`` signal, after the response has gone out, from a timer
+thread started with each new batch (so entries aren't left waiting for the
+next request, or lost when an idle worker is killed), and once more at
+interpreter exit. Any flush cancels the pending timer, so no timer thread
+outlives the entries it was started for.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection
+from django.utils import timezone
+
+from .models import ScanRecord
+
+logger = logging.getLogger(__name__)
+
+def _batch_size():
+    return getattr(settings, 'CHECKIN_LEDGER_BATCH_SIZE', 200)
+
+def _flush_interval():
+    return getattr(settings, 'CHECKIN_LEDGER_FLUSH_INTERVAL', 5)
+
+class LedgerBuffer:
+    def __init__(self, max_entries=10000):
+        # Entries beyond this are dropped (and logged) if the database stays unavailable
+        self.max_entries = max_entries
+        self._entries = []
+        self._oldest = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                logger.warning('Scan ledger buffer full, dropping entry')
+                return
+            if not self._entries:
+                self._oldest = time.monotonic()
+                self._schedule()
+            self._entries.append(record)
+
+    def _schedule(self):
+        # Called with the lock held when a new batch starts
+        if self._timer is None and _flush_interval() > 0:
+            self._timer = threading.Timer(_flush_interval(), self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread's own database connection
+            connection.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def due(self):
+        with self._lock:
+            if not self._entries:
+                return False
+            return len(self._entries) >= _batch_size() or time.monotonic() - self._oldest >= _flush_interval()
+
+    def flush(self):
+        """Write all buffered entries; returns how many were written"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            # Nothing left for it; a timer outliving its batch could fire after the database is gone
+            timer.cancel()
+        if not entries:
+            return 0
+        try:
+            ScanRecord.objects.bulk_create(entries, batch_size=_batch_size())
+        except Exception:
+            logger.exception('Could not write %d scan ledger entries', len(entries))
+            return 0
+        return len(entries)
+
+buffer = LedgerBuffer()
+
+def record(action, outcome, event_id=None, registration_id=None, user=None, gate='', device='',
+           latency_ms=None, occurred_at=None):
+    """Buffer one ledger entry; never touches the database"""
+    buffer.append(ScanRecord(
+        action=action,
+        outcome=outcome,
+        event_id=event_id,
+        registration_id=registration_id,
+        scanned_by_id=getattr(user, 'pk', None),
+        gate=(gate or '')[:50],
+        device=(device or '')[:100],
+        latency_ms=latency_ms,
+        occurred_at=occurred_at or timezone.now(),
+    ))
+
+def flush_if_due(**kwargs):
+    if buffer.due():
+        buffer.flush()
+
+request_finished.connect(flush_if_due, dispatch_uid='checkin.ledger.flush_if_due')
+atexit.register(buffer.flush)
@@ -0,0 +1,91 @@
+"""Live attendance updates for dashboards and scanners
+
+Check-in views and registration signals publish per-event counter deltas once
+the surrounding transaction commits; ``EventStreamView`` relays them to the
+browser as server-sent events. Counter keys are ``registered`` plus one per
+registration status.
+"""
+import asyncio
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from events.models import Event, Registration
+
+from .broker import get_broker
+
+STATUSES = [status for status, _ in Registration.STATUS_CHOICES]
+
+def channel_name(event_id):
+    return f'checkin:event:{event_id}'
+
+async def acounters(event_id):
+    """Current counters of an event.
+
+    ``registered`` and ``attended`` are the event's counter columns; only
+    cancelled registrations are counted, through the (event, status) index.
+    """
+    event = await Event.objects.filter(pk=event_id).values('registration_count', 'attended_count').afirst()
+    if event is None:
+        return dict.fromkeys(['registered'] + STATUSES, 0)
+    cancelled = await Registration.objects.filter(event_id=event_id, status='cancelled').acount()
+    return {
+        'registered': event['registration_count'],
+        'attended': event['attended_count'],
+        'pending': event['registration_count'] - event['attended_count'] - cancelled,
+        'cancelled': cancelled,
+    }
+
+def _publish(event_id, message, recent=()):
+    def publish():
+        get_broker().publish(channel_name(event_id), message, recent)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        transaction.on_commit(publish)
+    else:
+        # Async views write in autocommit mode, so there is no transaction to wait for
+        publish()
+
+def publish_check_ins(event_id, check_ins):
+    """Publish check-ins of one event.
+
+    ``check_ins`` are dicts with ``registration_id``, ``participant_name``,
+    ``attended_at`` and the ``previous_status`` the row had before the UPDATE.
+    """
+    if not check_ins:
+        return
+    delta = {'attended': len(check_ins)}
+    for item in check_ins:
+        delta[item['previous_status']] = delta.get(item['previous_status'], 0) - 1
+    recent = [
+        {
+            'registration_id': item['registration_id'],
+            'participant_name': item['participant_name'],
+            'attended_at': item['attended_at'].isoformat(),
+            'previous_status': item['previous_status'],
+        }
+        for item in check_ins
+    ]
+    _publish(event_id, {'type': 'checkin', 'delta': delta, 'check_ins': recent}, recent)
+
+def publish_status_change(event_id, old_status=None, new_status=None):
+    """Publish a registration being created (no old status), deleted (no new status) or moved between statuses"""
+    delta = {}
+    if old_status is None:
+        delta['registered'] = 1
+    if new_status is None:
+        delta['registered'] = -1
+    if old_status is not None:
+        delta[old_status] = -1
+    if new_status is not None:
+        delta[new_status] = delta.get(new_status, 0) + 1
+    if any(delta.values()):
+        _publish(event_id, {'type': 'registration', 'delta': delta})
+
+def sse_message(event, data, retry=None):
+    """Encode one server-sent event; ``retry`` tells EventSource how long to wait before reconnecting"""
+    lines = [f'retry: {retry}'] if retry is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,316 @@
+import argparse
+import http.client
+import json
+import queue
+import random
+import ssl
+import subprocess
+import threading
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from checkin.models import ScanRecord
+from events.models import Event, Registration
+from events.qr_payload import make_payload
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Scanner(threading.Thread):
+    """One simulated gate: a keep-alive connection working through the shared scan queue"""
+
+    def __init__(self, command, number, jobs, results):
+        super().__init__(name=f'scanner-{number}', daemon=True)
+        self.command = command
+        self.number = number
+        self.jobs = jobs
+        self.results = results
+
+    def run(self):
+        connection = self.command.connect()
+        while True:
+            try:
+                registration_id, payload = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if self.command.mode == 'scan-checkin':
+                self.request(connection, 'scan', self.command.scan_path,
+                             {'qr_code': payload, 'event_id': self.command.event.pk, 'mode': 'checkin'}, registration_id)
+            else:
+                found = self.request(connection, 'scan', self.command.scan_path,
+                                     {'qr_code': payload, 'event_id': self.command.event.pk}, registration_id)
+                if found and found.get('status') != 'attended':
+                    self.request(connection, 'checkin', self.command.checkin_path,
+                                 {'registration_id': found['registration_id'], 'event_id': self.command.event.pk},
+                                 registration_id)
+        connection.close()
+
+    def request(self, connection, endpoint, path, payload, registration_id):
+        payload.update({'gate': f'loadtest-{self.number}', 'device': self.name})
+        body = json.dumps(payload)
+        started = time.perf_counter()
+        try:
+            connection.request('POST', path, body=body, headers=self.command.headers)
+            response = connection.getresponse()
+            raw = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            # No HTTP status: counted as an error, with the exception kept apart from the response data
+            self.results.append((endpoint, (time.perf_counter() - started) * 1000, None, {}, str(e), registration_id))
+            return None
+        elapsed = (time.perf_counter() - started) * 1000
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = {}
+        self.results.append((endpoint, elapsed, status, data, None, registration_id))
+        return data if status == 200 else None
+
+
+class Command(BaseCommand):
+    help = 'Load test the check-in APIs of a running server with simulated concurrent scanners'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of a server using this project\'s database and session store')
+        parser.add_argument('--registrations', type=int, default=500, help='Registrations in the synthetic event')
+        parser.add_argument('--scanners', type=int, default=8, help='Concurrent simulated scanners')
+        parser.add_argument('--duplicate-rate', type=float, default=0.1,
+                            help='Fraction of badges scanned a second time, often by another gate')
+        parser.add_argument('--mode', choices=['scan-checkin', 'lookup-checkin'], default='scan-checkin',
+                            help='One-request scan-to-check-in, or a lookup followed by the check-in API')
+        parser.add_argument('--warm', action=argparse.BooleanOptionalAction, default=True,
+                            help='Open the scanner page first so the server warms its hot roster')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the scan order')
+        parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this file')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic event, user and ledger entries')
+
+    def handle(self, *args, **options):
+        if options['registrations'] < 1 or options['scanners'] < 1:
+            raise CommandError('--registrations and --scanners must be positive')
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f'Invalid --url: {options["url"]}')
+        self.url = url
+        self.insecure = options['insecure']
+        self.mode = options['mode']
+        self.scan_path = reverse('checkin:scan_qr_api')
+        self.checkin_path = reverse('checkin:checkin_api')
+
+        user, self.event, registrations = self.create_fixture(options['registrations'])
+        self.session = None
+        try:
+            self.headers = self.authenticate(user)
+            if options['warm']:
+                self.warm_roster()
+            report = self.run_scanners(registrations, options)
+        finally:
+            if not options['keep']:
+                self.cleanup(user)
+
+        self.print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Report written to {options["json_path"]}')
+
+    def create_fixture(self, count):
+        suffix = get_random_string(8).lower()
+        user = User.objects.create_user(f'loadtest-{suffix}', password=get_random_string(32))
+        today = timezone.localdate()
+        event = Event.objects.create(
+            organizer=user, name=f'Load test {suffix}', description='Synthetic event created by checkin_loadtest',
+            start_date=today, end_date=today, start_time='09:00', end_time='17:00', location='Load test',
+            is_published=True,
+        )
+        # bulk_create skips save(), so no QR images are rendered for the fixture
+        registrations = Registration.objects.bulk_create(
+            [Registration(event=event, participant_name=f'Participant {i}') for i in range(count)],
+            batch_size=500,
+        )
+        if registrations[0].pk is None:
+            registrations = list(Registration.objects.filter(event=event).order_by('pk'))
+        # bulk_create skips the signals that maintain the event counters
+        Event.objects.filter(pk=event.pk).update(registration_count=count)
+        self.stdout.write(f'Created event {event.pk} with {count} registrations')
+        return user, event, registrations
+
+    def authenticate(self, user):
+        """Session and CSRF headers for the synthetic organizer, without going through the login form"""
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.session = session
+        csrf_token = get_random_string(32)
+        return {
+            'Content-Type': 'application/json',
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}',
+            'X-CSRFToken': csrf_token,
+            'Referer': f'{self.url.scheme}://{self.url.netloc}/',
+        }
+
+    def connect(self):
+        if self.url.scheme == 'https':
+            context = ssl._create_unverified_context() if self.insecure else ssl.create_default_context()
+            return http.client.HTTPSConnection(self.url.hostname, self.url.port, timeout=30, context=context)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=30)
+
+    def warm_roster(self):
+        connection = self.connect()
+        try:
+            connection.request('GET', reverse('checkin:qr_scanner', args=[self.event.pk]), headers=self.headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise CommandError(f'Could not reach {self.url.geturl()}: {e}')
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise CommandError(f'Scanner page returned HTTP {response.status}; is the server using this database?')
+
+    def run_scanners(self, registrations, options):
+        rng = random.Random(options['seed'])
+        jobs = [(r.pk, make_payload(r)) for r in registrations]
+        repeats = rng.sample(jobs, int(len(jobs) * options['duplicate_rate']))
+        jobs.extend(repeats)
+        rng.shuffle(jobs)
+
+        work = queue.Queue()
+        for job in jobs:
+            work.put(job)
+        results = []
+        scanners = [Scanner(self, number, work, results) for number in range(options['scanners'])]
+
+        self.stdout.write(f'Running {len(jobs)} scans ({len(repeats)} repeats) with {len(scanners)} scanners')
+        started_at = timezone.now()
+        started = time.perf_counter()
+        for scanner in scanners:
+            scanner.start()
+        for scanner in scanners:
+            scanner.join()
+        wall_seconds = time.perf_counter() - started
+
+        return self.build_report(results, jobs, repeats, started_at, wall_seconds, options)
+
+    def build_report(self, results, jobs, repeats, started_at, wall_seconds, options):
+        endpoints = {}
+        check_ins = {}
+        already = 0
+        for endpoint, elapsed, status, data, error, registration_id in results:
+            stats = endpoints.setdefault(endpoint, {'latencies': [], 'errors': 0, 'statuses': {}, 'transport_errors': {}})
+            stats['latencies'].append(elapsed)
+            if error is not None:
+                stats['errors'] += 1
+                stats['transport_errors'][error] = stats['transport_errors'].get(error, 0) + 1
+                continue
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            expected_conflict = endpoint == 'checkin' and status == 400 and data.get('error') == 'Already checked in'
+            if status != 200 and not expected_conflict:
+                stats['errors'] += 1
+            if status == 200 and (data.get('checked_in') or data.get('success')):
+                check_ins[registration_id] = check_ins.get(registration_id, 0) + 1
+            elif data and (data.get('already_checked_in') or expected_conflict or data.get('status') == 'attended'):
+                already += 1
+
+        report_endpoints = {}
+        for endpoint, stats in endpoints.items():
+            latencies = sorted(stats['latencies'])
+            report_endpoints[endpoint] = {
+                'requests': len(latencies),
+                'errors': stats['errors'],
+                'error_rate': stats['errors'] / len(latencies),
+                'statuses': stats['statuses'],
+                'transport_errors': stats['transport_errors'],
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'max_ms': latencies[-1],
+                'mean_ms': sum(latencies) / len(latencies),
+            }
+
+        attended = Registration.objects.filter(event=self.event, status='attended').count()
+        return {
+            'commit': self.git_commit(),
+            'started_at': started_at.isoformat(),
+            'url': self.url.geturl(),
+            'parameters': {
+                'registrations': options['registrations'],
+                'scanners': options['scanners'],
+                'duplicate_rate': options['duplicate_rate'],
+                'mode': options['mode'],
+                'warm': options['warm'],
+                'seed': options['seed'],
+                'qr_payload_format': getattr(settings, 'QR_PAYLOAD_FORMAT', 'uuid'),
+            },
+            'wall_seconds': wall_seconds,
+            'scans': len(jobs),
+            'scans_per_second': len(jobs) / wall_seconds if wall_seconds else None,
+            'endpoints': report_endpoints,
+            'duplicates': {
+                'repeat_scans': len(repeats),
+                'already_checked_in_responses': already,
+                # Badges reported as freshly checked in more than once: must be 0
+                'double_check_ins': sum(1 for count in check_ins.values() if count > 1),
+            },
+            'attended_in_database': attended,
+            'missed_check_ins': options['registrations'] - attended,
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def cleanup(self, user):
+        ScanRecord.objects.filter(event_id=self.event.pk).delete()
+        self.event.delete()
+        if self.session is not None:
+            self.session.delete()
+        user.delete()
+
+    def print_report(self, report):
+        self.stdout.write('')
+        self.stdout.write(
+            f'{report["scans"]} scans in {report["wall_seconds"]:.2f}s '
+            f'({report["scans_per_second"]:.1f} scans/s) at commit {report["commit"] or "unknown"}'
+        )
+        self.stdout.write(f'{"endpoint":<10} {"requests":>9} {"errors":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f'{endpoint:<10} {stats["requests"]:>9} {stats["errors"]:>7} {stats["p50_ms"]:>8.1f} '
+                f'{stats["p95_ms"]:>8.1f} {stats["p99_ms"]:>8.1f} {stats["max_ms"]:>8.1f}'
+            )
+            for error, count in stats['transport_errors'].items():
+                self.stdout.write(self.style.WARNING(f'  {count} x no response: {error}'))
+        duplicates = report['duplicates']
+        self.stdout.write(
+            f'Repeat scans: {duplicates["repeat_scans"]}, already-checked-in responses: '
+            f'{duplicates["already_checked_in_responses"]}, double check-ins: {duplicates["double_check_ins"]}'
+        )
+        style = self.style.SUCCESS if not duplicates['double_check_ins'] and not report['missed_check_ins'] else self.style.ERROR
+        self.stdout.write(style(
+            f'{report["attended_in_database"]} attended in the database, {report["missed_check_ins"]} missed'
+        ))
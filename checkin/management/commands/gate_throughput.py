@@ -0,0 +1,106 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from checkin.models import ScanRecord
+from events.models import Event
+
+REJECTED = ['wrong_event', 'unauthorized', 'not_found', 'invalid']
+REPEATED = ['already_checked_in', 'duplicate']
+
+
+class Command(BaseCommand):
+    help = 'Per-minute scan throughput of each gate of an event, from the scan ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event', type=int, help='Event ID')
+        parser.add_argument('--since', help='Only scans at or after this ISO 8601 time')
+        parser.add_argument('--until', help='Only scans before this ISO 8601 time')
+        parser.add_argument('--gate', help='Only this gate')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.only('id', 'name').get(pk=options['event'])
+        except Event.DoesNotExist:
+            raise CommandError(f'Event {options["event"]} does not exist')
+
+        records = ScanRecord.objects.filter(event_id=event.pk)
+        for option, lookup in (('since', 'occurred_at__gte'), ('until', 'occurred_at__lt')):
+            if options[option]:
+                records = records.filter(**{lookup: self.parse_time(options[option])})
+        if options['gate'] is not None:
+            records = records.filter(gate=options['gate'])
+
+        rows = list(
+            records.annotate(minute=TruncMinute('occurred_at'))
+            .values('gate', 'minute')
+            .annotate(
+                scans=Count('id'),
+                checked_in=Count('id', filter=Q(outcome='checked_in')),
+                repeated=Count('id', filter=Q(outcome__in=REPEATED)),
+                rejected=Count('id', filter=Q(outcome__in=REJECTED)),
+                avg_latency_ms=Avg('latency_ms'),
+                max_latency_ms=Max('latency_ms'),
+            )
+            .order_by('gate', 'minute')
+        )
+        gates = self.summarize(rows)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'event_id': event.pk,
+                'gates': gates,
+                'minutes': rows,
+            }, indent=2, cls=DjangoJSONEncoder))
+            return
+
+        self.stdout.write(f'Gate throughput for {event.name}')
+        if not rows:
+            self.stdout.write('No scans recorded')
+            return
+        self.stdout.write(f'{"Gate":<16} {"Minute":<17} {"Scans":>6} {"In":>6} {"Repeat":>7} {"Reject":>7} {"Avg ms":>7} {"Max ms":>7}')
+        for row in rows:
+            self.stdout.write(
+                f'{row["gate"] or "-":<16} {timezone.localtime(row["minute"]):%Y-%m-%d %H:%M} '
+                f'{row["scans"]:>6} {row["checked_in"]:>6} {row["repeated"]:>7} {row["rejected"]:>7} '
+                f'{self.ms(row["avg_latency_ms"]):>7} {self.ms(row["max_latency_ms"]):>7}'
+            )
+        self.stdout.write('')
+        for gate in gates:
+            self.stdout.write(self.style.SUCCESS(
+                f'{gate["gate"] or "-"}: {gate["scans"]} scans over {gate["minutes"]} minute(s), '
+                f'{gate["scans_per_minute"]:.1f}/min average, peak {gate["peak_scans_per_minute"]}/min '
+                f'at {timezone.localtime(gate["peak_minute"]):%H:%M}'
+            ))
+
+    def summarize(self, rows):
+        gates = {}
+        for row in rows:
+            gate = gates.setdefault(row['gate'], {
+                'gate': row['gate'], 'scans': 0, 'checked_in': 0, 'repeated': 0, 'rejected': 0,
+                'minutes': 0, 'peak_scans_per_minute': 0, 'peak_minute': None,
+            })
+            for key in ('scans', 'checked_in', 'repeated', 'rejected'):
+                gate[key] += row[key]
+            gate['minutes'] += 1
+            if row['scans'] > gate['peak_scans_per_minute']:
+                gate['peak_scans_per_minute'] = row['scans']
+                gate['peak_minute'] = row['minute']
+        for gate in gates.values():
+            gate['scans_per_minute'] = gate['scans'] / gate['minutes']
+        return list(gates.values())
+
+    def parse_time(self, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid time: {value}')
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    def ms(self, value):
+        return '-' if value is None else f'{value:.0f}'
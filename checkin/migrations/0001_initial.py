@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('events', '0004_registration_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gate', models.CharField(blank=True, max_length=50)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('action', models.CharField(choices=[('lookup', 'Lookup'), ('checkin', 'Check-in'), ('batch', 'Offline batch')], max_length=20)),
+                ('outcome', models.CharField(choices=[('found', 'Found'), ('checked_in', 'Checked in'), ('already_checked_in', 'Already checked in'), ('duplicate', 'Duplicate in batch'), ('wrong_event', 'Wrong event'), ('unauthorized', 'Unauthorized'), ('not_found', 'Not found'), ('invalid', 'Invalid')], max_length=20)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('occurred_at', models.DateTimeField()),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='scan_records', to='events.event')),
+                ('registration', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='scan_records', to='events.registration')),
+                ('scanned_by', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+                'indexes': [models.Index(fields=['event', 'gate', 'occurred_at'], name='checkin_sca_event_i_c65d3a_idx')],
+            },
+        ),
+    ]
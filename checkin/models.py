@@ -1,3 +1,53 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+from events.models import Event, Registration
+
+class ScanRecord(models.Model):
+    """Append-only ledger entry for one scan or check-in attempt at a gate"""
+    ACTION_CHOICES = [
+        ('lookup', 'Lookup'),
+        ('checkin', 'Check-in'),
+        ('batch', 'Offline batch'),
+    ]
+    OUTCOME_CHOICES = [
+        ('found', 'Found'),
+        ('checked_in', 'Checked in'),
+        ('already_checked_in', 'Already checked in'),
+        ('duplicate', 'Duplicate in batch'),
+        ('wrong_event', 'Wrong event'),
+        ('unauthorized', 'Unauthorized'),
+        ('not_found', 'Not found'),
+        ('invalid', 'Invalid'),
+    ]
+
+    # No database constraints: ledger entries are written in buffered batches after
+    # the fact, may name ids a scanner merely claimed, and outlive deleted registrations
+    event = models.ForeignKey(Event, on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, blank=True, related_name='scan_records')
+    registration = models.ForeignKey(Registration, on_delete=models.DO_NOTHING, db_constraint=False,
+                                     null=True, blank=True, related_name='scan_records')
+    scanned_by = models.ForeignKey(User, on_delete=models.SET_NULL, db_constraint=False, null=True, blank=True)
+    gate = models.CharField(max_length=50, blank=True)
+    device = models.CharField(max_length=100, blank=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    # Server time spent on the request that produced the entry
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    # When the badge was scanned; offline batches carry the device's scan time
+    occurred_at = models.DateTimeField()
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-occurred_at']
+        indexes = [
+            models.Index(fields=['event', 'gate', 'occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.gate or 'No gate'} - {self.get_outcome_display()} ({self.occurred_at})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Scan records are append-only')
+        super().save(*args, **kwargs)
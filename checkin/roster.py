@@ -0,0 +1,277 @@
+"""Hot roster cache for scan lookups
+
+Entries for a live event are held in two tiers: a short-lived in-process dict
+and the shared Django cache. Both are keyed by the registration's unique_id;
+an immutable alias maps registration primary keys (used by signed QR payloads
+and check-in writes) to ``(event_id, unique_id)``. The event's name and
+organizer live once, in the event's warm marker, so changing the event updates
+every entry at once. The roster is warmed in a background thread when an
+organizer opens the scanner and check-in writes update entries in place, so
+scans for the active event are answered without a database query. Warming
+fills the shared cache only; the in-process tier holds what this process has
+actually scanned, up to ``CHECKIN_ROSTER_LOCAL_MAX`` entries.
+
+The roster needs a shared in-memory cache (memcached or redis). File and
+database caches scan or count their entries on every write, so with those the
+roster is off and scans read the database (``CHECKIN_ROSTER_ENABLED``
+overrides the detection).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection, transaction
+
+from events.models import Event, Registration
+
+logger = logging.getLogger(__name__)
+
+ENTRY_FIELDS = ['id', 'unique_id', 'event_id', 'participant_name', 'participant_email',
+                'status', 'registered_at', 'attended_at']
+
+def _timeout():
+    return getattr(settings, 'CHECKIN_ROSTER_TIMEOUT', 6 * 60 * 60)
+
+def _local_ttl():
+    # Bounds how stale another process's check-in can look on this one
+    return getattr(settings, 'CHECKIN_ROSTER_LOCAL_TTL', 5)
+
+def _local_max():
+    return getattr(settings, 'CHECKIN_ROSTER_LOCAL_MAX', 5000)
+
+def enabled():
+    setting = getattr(settings, 'CHECKIN_ROSTER_ENABLED', None)
+    if setting is not None:
+        return setting
+    return not isinstance(caches['default'], (FileBasedCache, DatabaseCache))
+
+def _entry_key(event_id, unique_id):
+    return f'checkin:roster:{event_id}:{unique_id}'
+
+def _alias_key(registration_id):
+    return f'checkin:roster:pk:{registration_id}'
+
+def _event_key(event_id):
+    return f'checkin:roster:event:{event_id}'
+
+def _warming_key(event_id):
+    return f'checkin:roster:warming:{event_id}'
+
+def _event_info(event):
+    return {'name': event.name, 'organizer_id': event.organizer_id}
+
+class LocalRoster:
+    """In-process tier: entries expire after a few seconds so other workers' writes show up quickly
+
+    Entries and aliases are each kept in a least-recently-used dict capped at
+    ``CHECKIN_ROSTER_LOCAL_MAX`` items, so long-lived processes don't keep
+    every roster they have ever scanned.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._aliases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, items, key, value):
+        items[key] = value
+        items.move_to_end(key)
+        while len(items) > _local_max():
+            items.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._put(self._entries, key, (time.monotonic() + _local_ttl(), entry))
+
+    def get_alias(self, registration_id):
+        with self._lock:
+            target = self._aliases.get(registration_id)
+            if target is not None:
+                self._aliases.move_to_end(registration_id)
+            return target
+
+    def set_alias(self, registration_id, target):
+        with self._lock:
+            self._put(self._aliases, registration_id, target)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+
+local_roster = LocalRoster()
+
+def _store(entries, local=True):
+    """Write entries (dicts of ENTRY_FIELDS) to the shared cache, and to this process's tier if ``local``"""
+    shared = {}
+    for entry in entries:
+        key = _entry_key(entry['event_id'], entry['unique_id'])
+        target = (entry['event_id'], str(entry['unique_id']))
+        shared[key] = entry
+        shared[_alias_key(entry['id'])] = target
+        if local:
+            local_roster.set(key, entry)
+            local_roster.set_alias(entry['id'], target)
+    if shared:
+        cache.set_many(shared, timeout=_timeout())
+
+def is_warm(event_id):
+    return cache.get(_event_key(event_id)) is not None
+
+def warm(event, chunk_size=2000):
+    """Load the whole roster of an event into the shared cache"""
+    chunk = []
+    for entry in Registration.objects.filter(event=event).order_by().values(*ENTRY_FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            _store(chunk, local=False)
+            chunk = []
+    _store(chunk, local=False)
+    # Marked warm only once complete; registration writes are mirrored from then on
+    cache.set(_event_key(event.pk), _event_info(event), timeout=_timeout())
+
+def _warm_in_thread(event):
+    try:
+        warm(event)
+    except Exception:
+        logger.exception('Could not warm the check-in roster of event %s', event.pk)
+    finally:
+        cache.delete(_warming_key(event.pk))
+        connection.close()
+
+def start_warming(event):
+    """Warm an event's roster in a background thread, once, after the current transaction commits
+
+    Scans made before it finishes are answered from the database.
+    """
+    if not enabled() or is_warm(event.pk):
+        return
+    if not cache.add(_warming_key(event.pk), True, timeout=15 * 60):
+        # Another request or process is already warming it
+        return
+    thread = threading.Thread(target=_warm_in_thread, args=(event,), daemon=True)
+    transaction.on_commit(thread.start)
+
+def event_changed(event):
+    """Carry a saved event's name and organizer into its warm roster"""
+    if enabled() and is_warm(event.pk):
+        cache.set(_event_key(event.pk), _event_info(event), timeout=_timeout())
+        local_roster.set(_event_key(event.pk), _event_info(event))
+
+def _to_registration(entry, info):
+    """Build a Registration with its event attached from a cached entry, without querying"""
+    registration = Registration(**{field: entry[field] for field in ENTRY_FIELDS})
+    registration._state.adding = False
+    registration.event = Event(id=entry['event_id'], name=info['name'], organizer_id=info['organizer_id'])
+    return registration
+
+def _get_cached(key):
+    value = local_roster.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            local_roster.set(key, value)
+    return value
+
+def _resolve_alias(registration_id):
+    target = local_roster.get_alias(registration_id)
+    if target is None:
+        target = cache.get(_alias_key(registration_id))
+        if target is not None:
+            local_roster.set_alias(registration_id, target)
+    return target
+
+def lookup(event_id, unique_id=None, registration_id=None):
+    """Return a Registration (with ``event`` attached) for the active event, or None on a miss"""
+    if not enabled():
+        return None
+    if registration_id is not None:
+        target = _resolve_alias(registration_id)
+        if target is None or target[0] != event_id:
+            return None
+        unique_id = target[1]
+    info = _get_cached(_event_key(event_id))
+    if info is None:
+        return None
+    entry = _get_cached(_entry_key(event_id, str(unique_id)))
+    return _to_registration(entry, info) if entry is not None else None
+
+async def _aget_cached(key):
+    value = local_roster.get(key)
+    if value is None:
+        value = await cache.aget(key)
+        if value is not None:
+            local_roster.set(key, value)
+    return value
+
+async def _aresolve_alias(registration_id):
+    target = local_roster.get_alias(registration_id)
+    if target is None:
+        target = await cache.aget(_alias_key(registration_id))
+        if target is not None:
+            local_roster.set_alias(registration_id, target)
+    return target
+
+async def alookup(event_id, unique_id=None, registration_id=None):
+    """Async lookup() for the ASGI views"""
+    if not enabled():
+        return None
+    if registration_id is not None:
+        target = await _aresolve_alias(registration_id)
+        if target is None or target[0] != event_id:
+            return None
+        unique_id = target[1]
+    info = await _aget_cached(_event_key(event_id))
+    if info is None:
+        return None
+    entry = await _aget_cached(_entry_key(event_id, str(unique_id)))
+    return _to_registration(entry, info) if entry is not None else None
+
+def remember(registration):
+    """Cache a registration that was just loaded from the database, if its event's roster is warm"""
+    refresh(registration)
+
+def record_check_ins(attended_at_by_id):
+    """Keep cached entries coherent after check-in writes"""
+    if not enabled():
+        return
+    for registration_id, attended_at in attended_at_by_id.items():
+        target = _resolve_alias(registration_id)
+        if target is None:
+            continue
+        entry = _get_cached(_entry_key(*target))
+        if entry is None:
+            continue
+        entry = dict(entry, status='attended', attended_at=attended_at)
+        key = _entry_key(*target)
+        cache.set(key, entry, timeout=_timeout())
+        local_roster.set(key, entry)
+
+def refresh(registration):
+    """Mirror a saved registration into a warm roster (new registrations, admin edits, cancellations)"""
+    if enabled() and is_warm(registration.event_id):
+        _store([{field: getattr(registration, field) for field in ENTRY_FIELDS}])
+
+def forget(registration):
+    if not enabled():
+        return
+    key = _entry_key(registration.event_id, registration.unique_id)
+    cache.delete_many([key, _alias_key(registration.pk)])
+    local_roster.clear()
@@ -0,0 +1,33 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from events.models import Event, Registration
+
+from . import roster
+from .live import publish_status_change
+
+
+@receiver(post_save, sender=Registration)
+def mirror_registration(sender, instance, created, **kwargs):
+    roster.refresh(instance)
+    if created:
+        publish_status_change(instance.event_id, new_status=instance.status)
+        return
+    loaded_status = getattr(instance, '_loaded_status', None)
+    if loaded_status is not None and loaded_status != instance.status:
+        publish_status_change(instance.event_id, loaded_status, instance.status)
+
+
+@receiver(post_delete, sender=Registration)
+def drop_registration(sender, instance, **kwargs):
+    roster.forget(instance)
+    publish_status_change(instance.event_id, old_status=instance.status)
+
+
+@receiver(post_save, sender=Event)
+def mirror_event(sender, instance, **kwargs):
+    # Name and organizer are read from the roster's event marker by every scan
+    transaction.on_commit(partial(roster.event_changed, instance))
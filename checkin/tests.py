@@ -1,3 +1,430 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import json
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from events.models import Event, Registration
+from events.qr_payload import sign_payload
+
+from . import async_views, ledger, roster
+from .attendance import check_in, check_in_many
+from .idempotency import IN_PROGRESS, _cache_key
+from .models import ScanRecord
+
+
+def create_event(organizer, name='Conference'):
+    today = datetime.date.today()
+    return Event.objects.create(
+        organizer=organizer, name=name, start_date=today, end_date=today,
+        start_time=datetime.time(9), end_time=datetime.time(17), location='Hall', is_published=True,
+    )
+
+
+# A ledger batch size of 1 writes scan records when each test request finishes
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=1)
+class CheckInTests(TestCase):
+    """The conditional UPDATE checks a registration in exactly once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='password')
+        cls.event = create_event(cls.organizer)
+
+    def test_second_check_in_is_refused(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        attended_at = check_in(registration.pk, self.event.pk)
+        self.assertIsNotNone(attended_at)
+        self.assertIsNone(check_in(registration.pk, self.event.pk))
+
+        registration.refresh_from_db()
+        self.assertEqual(registration.status, 'attended')
+        self.assertEqual(registration.attended_at, attended_at)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attended_count, 1)
+
+    def test_cancelled_registration_can_be_checked_in(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada', status='cancelled')
+        self.assertIsNotNone(check_in(registration.pk, self.event.pk))
+        registration.refresh_from_db()
+        self.assertEqual(registration.status, 'attended')
+
+    def test_check_in_many_keeps_each_scan_time(self):
+        first = Registration.objects.create(event=self.event, participant_name='Ada')
+        second = Registration.objects.create(event=self.event, participant_name='Grace')
+        done = Registration.objects.create(event=self.event, participant_name='Alan')
+        check_in(done.pk, self.event.pk)
+        done.refresh_from_db()
+
+        scanned = timezone.now() - datetime.timedelta(hours=1)
+        updated = check_in_many({
+            first.pk: scanned,
+            second.pk: scanned + datetime.timedelta(minutes=5),
+            done.pk: scanned,
+        })
+
+        self.assertEqual(updated, 2)
+        attended_at = dict(Registration.objects.values_list('pk', 'attended_at'))
+        self.assertEqual(attended_at[first.pk], scanned)
+        self.assertEqual(attended_at[second.pk], scanned + datetime.timedelta(minutes=5))
+        self.assertEqual(attended_at[done.pk], done.attended_at)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attended_count, 3)
+
+    def test_api_reports_the_update_outcome(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        self.client.force_login(self.organizer)
+        url = reverse('checkin:checkin_api')
+        body = {'registration_id': registration.pk, 'event_id': self.event.pk}
+
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['previous_status'], 'pending')
+
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Already checked in')
+
+
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=1)
+class BatchCheckInTests(TestCase):
+    """Queued offline scans are classified per scan and applied in one transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='password')
+        cls.event = create_event(cls.organizer)
+        cls.other_event = create_event(cls.organizer, name='Workshop')
+        cls.stranger_event = create_event(User.objects.create_user('stranger', password='password'), name='Other')
+
+    def setUp(self):
+        self.client.force_login(self.organizer)
+        self.scanned = timezone.now().replace(microsecond=0) - datetime.timedelta(hours=1)
+
+    def post(self, scans, event_id=None):
+        response = self.client.post(
+            reverse('checkin:batch_checkin_api'),
+            {'event_id': event_id or self.event.pk, 'scans': scans},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def at(self, minutes):
+        return (self.scanned + datetime.timedelta(minutes=minutes)).isoformat()
+
+    def test_earliest_scan_wins(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        data = self.post([
+            {'qr_code': str(registration.unique_id), 'scanned_at': self.at(10)},
+            {'registration_id': registration.pk, 'scanned_at': self.at(2)},
+        ])
+
+        self.assertEqual(data['checked_in'], 1)
+        self.assertEqual([result['result'] for result in data['results']], ['duplicate', 'checked_in'])
+        self.assertEqual(data['results'][0]['attended_at'], self.at(2))
+        registration.refresh_from_db()
+        self.assertEqual(registration.attended_at, self.scanned + datetime.timedelta(minutes=2))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attended_count, 1)
+
+    def test_scans_are_classified(self):
+        attended = Registration.objects.create(event=self.event, participant_name='Alan')
+        check_in(attended.pk, self.event.pk)
+        wrong_event = Registration.objects.create(event=self.other_event, participant_name='Grace')
+        foreign = Registration.objects.create(event=self.stranger_event, participant_name='Eve')
+
+        data = self.post([
+            {'registration_id': attended.pk},
+            {'registration_id': wrong_event.pk},
+            {'registration_id': foreign.pk},
+            {'registration_id': 999999},
+            {'registration_id': attended.pk, 'scanned_at': 'yesterday'},
+        ])
+
+        self.assertEqual(
+            [result['result'] for result in data['results']],
+            ['already_checked_in', 'wrong_event', 'unauthorized', 'not_found', 'invalid'],
+        )
+        self.assertNotIn('participant_name', data['results'][2])
+        self.assertEqual(data['checked_in'], 0)
+        self.assertFalse(Registration.objects.filter(pk__in=[wrong_event.pk, foreign.pk], status='attended').exists())
+
+    def test_scanner_clock_ahead_of_server_is_clamped(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        before = timezone.now()
+        self.post([{'registration_id': registration.pk, 'scanned_at': self.at(24 * 60)}])
+        registration.refresh_from_db()
+        self.assertLessEqual(registration.attended_at, timezone.now())
+        self.assertGreaterEqual(registration.attended_at, before)
+
+    def test_queued_tokens_are_verified(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        token = sign_payload(self.event.pk, registration.pk)
+        forged = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        
+        data = self.post([{'qr_code': forged}, {'qr_code': token.lower()}])
+        
+        self.assertEqual([result['result'] for result in data['results']], ['invalid', 'checked_in'])
+        self.assertEqual(data['results'][0]['error'], 'Invalid QR code signature')
+
+    def test_roster_snapshot_carries_token_signatures(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        response = self.client.get(reverse('checkin:roster_snapshot', args=[self.event.pk]))
+        snapshot = response.json()
+        row = dict(zip(snapshot['fields'], snapshot['entries'][0]))
+        self.assertEqual(row['signature'], sign_payload(self.event.pk, registration.pk).rsplit('.', 1)[1])
+
+
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=1)
+class IdempotencyTests(TestCase):
+    """Retries with the same Idempotency-Key replay the first response instead of checking in again"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='password')
+        cls.event = create_event(cls.organizer)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.organizer)
+        self.url = reverse('checkin:checkin_api')
+        self.registration = Registration.objects.create(event=self.event, participant_name='Ada')
+
+    def post(self, body, key='scan-1'):
+        return self.client.post(self.url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        body = {'registration_id': self.registration.pk}
+        first = self.post(body)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        retry = self.post(body)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        # A new key runs the view: the registration is already checked in
+        self.assertEqual(self.post(body, key='scan-2').status_code, 400)
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        self.post({'registration_id': self.registration.pk})
+        response = self.post({'registration_id': self.registration.pk + 1})
+        self.assertEqual(response.status_code, 422)
+
+    def test_retry_while_the_original_runs_gets_409(self):
+        body = {'registration_id': self.registration.pk}
+        request = SimpleNamespace(path=self.url, user=self.organizer)
+        fingerprint = hashlib.sha256(json.dumps(body).encode()).hexdigest()
+        cache.set(_cache_key(request, 'scan-1'), (IN_PROGRESS, fingerprint))
+
+        response = self.post(body)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.status, 'pending')
+
+
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=1, QR_PAYLOAD_FORMAT='signed')
+class SignedPayloadScanTests(TestCase):
+    """Scans verify R1 tokens and their event before any lookup, cold or from the hot roster"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='password')
+        cls.event = create_event(cls.organizer)
+        cls.other_event = create_event(cls.organizer, name='Workshop')
+
+    def setUp(self):
+        cache.clear()
+        roster.local_roster.clear()
+        self.client.force_login(self.organizer)
+        self.registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        self.token = sign_payload(self.event.pk, self.registration.pk)
+
+    def scan(self, qr_code, mode=None):
+        body = {'qr_code': qr_code, 'event_id': self.event.pk}
+        if mode:
+            body['mode'] = mode
+        return self.client.post(reverse('checkin:scan_qr_api'), body, content_type='application/json')
+
+    def assert_refused(self, qr_code, status, error):
+        for mode in (None, 'checkin'):
+            response = self.scan(qr_code, mode)
+            self.assertEqual(response.status_code, status, mode)
+            self.assertEqual(response.json()['error'], error)
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.status, 'pending')
+
+    def check_token_handling(self):
+        tampered = self.token[:-1] + ('A' if self.token[-1] != 'A' else 'B')
+        self.assert_refused(tampered, 400, 'Invalid QR code signature')
+        # Signature of another registration spliced onto this one
+        other = Registration.objects.create(event=self.event, participant_name='Grace')
+        spliced = self.token.rsplit('.', 1)[0] + '.' + sign_payload(self.event.pk, other.pk).rsplit('.', 1)[1]
+        self.assert_refused(spliced, 400, 'Invalid QR code signature')
+        self.assert_refused('R1.1.2', 400, 'Invalid QR code format')
+
+        # Validly signed, but for the organizer's other event
+        workshop = Registration.objects.create(event=self.other_event, participant_name='Alan')
+        self.assert_refused(sign_payload(self.other_event.pk, workshop.pk), 400, 'QR code belongs to a different event')
+        # Signed for this event, but naming a registration of another event
+        self.assert_refused(sign_payload(self.event.pk, workshop.pk), 404, 'Registration not found')
+        self.assert_refused(str(workshop.unique_id), 400, 'QR code belongs to a different event')
+
+        lookup = self.scan(self.token.lower())
+        self.assertEqual(lookup.status_code, 200)
+        self.assertEqual(lookup.json()['registration_id'], self.registration.pk)
+        # Legacy UUID codes printed before the switch still work
+        self.assertEqual(self.scan(str(self.registration.unique_id)).json()['registration_id'], self.registration.pk)
+        self.assertTrue(self.scan(self.token, 'checkin').json()['checked_in'])
+
+    def test_cold_lookups(self):
+        self.check_token_handling()
+
+    @override_settings(CHECKIN_ROSTER_ENABLED=True)
+    def test_hot_roster_lookups(self):
+        roster.warm(self.event)
+        roster.warm(self.other_event)
+        self.check_token_handling()
+
+
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=3, CHECKIN_LEDGER_FLUSH_INTERVAL=60)
+class LedgerTests(TestCase):
+    """Scan ledger entries are buffered and written in batches after the response"""
+
+    def tearDown(self):
+        ledger.buffer.flush()
+
+    def test_batch_is_written_once_full(self):
+        for _ in range(2):
+            ledger.record('lookup', 'not_found')
+            ledger.flush_if_due()
+        self.assertEqual(ScanRecord.objects.count(), 0)
+        self.assertIsNotNone(ledger.buffer._timer)
+
+        ledger.record('lookup', 'found')
+        ledger.flush_if_due()
+        self.assertEqual(ScanRecord.objects.count(), 3)
+        self.assertEqual(len(ledger.buffer), 0)
+        # The flush cancelled the batch's timer
+        self.assertIsNone(ledger.buffer._timer)
+
+    @override_settings(CHECKIN_LEDGER_BATCH_SIZE=1)
+    def test_scan_is_recorded_when_the_request_finishes(self):
+        organizer = User.objects.create_user('organizer', password='password')
+        event = create_event(organizer)
+        registration = Registration.objects.create(event=event, participant_name='Ada')
+        self.client.force_login(organizer)
+        self.client.post(reverse('checkin:checkin_api'), {'registration_id': registration.pk, 'event_id': event.pk},
+                         content_type='application/json')
+
+        scan = ScanRecord.objects.get()
+        self.assertEqual((scan.action, scan.outcome, scan.registration_id), ('checkin', 'checked_in', registration.pk))
+        self.assertIsNone(ledger.buffer._timer)
+
+    def test_failed_write_is_logged(self):
+        ledger.record('lookup', 'found')
+        with mock.patch.object(ScanRecord.objects, 'bulk_create', side_effect=RuntimeError('database went away')):
+            with self.assertLogs('checkin.ledger', 'ERROR'):
+                self.assertEqual(ledger.buffer.flush(), 0)
+
+
+@override_settings(CHECKIN_LEDGER_BATCH_SIZE=100, CHECKIN_LEDGER_FLUSH_INTERVAL=0.01)
+class LedgerTimerTests(TransactionTestCase):
+    def test_timer_flushes_a_batch_left_by_the_last_request(self):
+        ledger.record('lookup', 'not_found')
+        timer = ledger.buffer._timer
+        timer.join(timeout=5)
+        self.assertEqual(ScanRecord.objects.count(), 1)
+        self.assertIsNone(ledger.buffer._timer)
+
+
+# The scanner endpoints routed to their async versions, as checkin/urls.py does under ASGI
+async_patterns = [
+    path('api/scan/', async_views.AsyncScanQRCodeAPIView.as_view(), name='scan_qr_api'),
+    path('api/checkin/', async_views.AsyncCheckinAPIView.as_view(), name='checkin_api'),
+    path('<int:pk>/roster/', async_views.AsyncRosterSnapshotAPIView.as_view(), name='roster_snapshot'),
+]
+urlpatterns = [path('checkin/', include((async_patterns, 'checkin')))]
+
+
+# The async client fires request_finished off the test's database connection, so
+# ledger entries stay buffered until the test flushes them
+@override_settings(QR_GENERATION_MODE='deferred', CHECKIN_LEDGER_BATCH_SIZE=100, CHECKIN_LEDGER_FLUSH_INTERVAL=60,
+                   ROOT_URLCONF=__name__)
+class AsyncViewTests(TestCase):
+    """The async scanner endpoints answer like their sync counterparts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='password')
+        cls.stranger = User.objects.create_user('stranger', password='password')
+        cls.event = create_event(cls.organizer)
+
+    def setUp(self):
+        cache.clear()
+        roster.local_roster.clear()
+        self.registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        self.addCleanup(ledger.buffer.flush)
+
+    async def post(self, name, body):
+        return await self.async_client.post(reverse(name), body, content_type='application/json')
+
+    async def test_scan_looks_up_and_checks_in(self):
+        await self.async_client.aforce_login(self.organizer)
+        body = {'qr_code': str(self.registration.unique_id), 'event_id': self.event.pk}
+
+        response = await self.post('checkin:scan_qr_api', body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'pending')
+
+        response = await self.post('checkin:scan_qr_api', dict(body, mode='checkin'))
+        self.assertTrue(response.json()['checked_in'])
+        response = await self.post('checkin:scan_qr_api', dict(body, mode='checkin'))
+        self.assertTrue(response.json()['already_checked_in'])
+
+    async def test_check_in_api(self):
+        await self.async_client.aforce_login(self.organizer)
+        body = {'registration_id': self.registration.pk, 'event_id': self.event.pk}
+
+        response = await self.post('checkin:checkin_api', body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['previous_status'], 'pending')
+        response = await self.post('checkin:checkin_api', body)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_roster_snapshot(self):
+        await self.async_client.aforce_login(self.organizer)
+        response = await self.async_client.get(reverse('checkin:roster_snapshot', args=[self.event.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry[1] for entry in response.json()['entries']], [self.registration.pk])
+
+    async def test_other_organizers_are_refused(self):
+        await self.async_client.aforce_login(self.stranger)
+        response = await self.post('checkin:scan_qr_api', {'qr_code': str(self.registration.unique_id)})
+        self.assertEqual(response.status_code, 403)
+        response = await self.post('checkin:checkin_api', {'registration_id': self.registration.pk})
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(reverse('checkin:roster_snapshot', args=[self.event.pk]))
+        self.assertEqual(response.status_code, 404)
+        await self.registration.arefresh_from_db()
+        self.assertEqual(self.registration.status, 'pending')
+        await sync_to_async(ledger.buffer.flush)()
+        outcomes = [outcome async for outcome in ScanRecord.objects.values_list('outcome', flat=True)]
+        self.assertEqual(outcomes, ['unauthorized', 'unauthorized'])
+
+    async def test_anonymous_requests_are_sent_to_login(self):
+        response = await self.post('checkin:scan_qr_api', {'qr_code': str(self.registration.unique_id)})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+        response = await self.post('checkin:checkin_api', {'registration_id': self.registration.pk})
+        self.assertEqual(response.status_code, 302)
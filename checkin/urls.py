@@ -1,12 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'checkin'
 
+# Under ASGI (see asgi.py) the scanner endpoints are served by their async versions
+if settings.CHECKIN_ASYNC_VIEWS:
+    scan_view = async_views.AsyncScanQRCodeAPIView
+    checkin_view = async_views.AsyncCheckinAPIView
+    roster_view = async_views.AsyncRosterSnapshotAPIView
+else:
+    scan_view = views.ScanQRCodeAPIView
+    checkin_view = views.CheckinAPIView
+    roster_view = views.RosterSnapshotAPIView
+
 urlpatterns = [
     path('', views.CheckinHomeView.as_view(), name='checkin_home'),
     path('<int:pk>/scanner/', views.QRScannerView.as_view(), name='qr_scanner'),
     path('<int:pk>/participants/', views.ParticipantListView.as_view(), name='participants'),
-    path('api/scan/', views.ScanQRCodeAPIView.as_view(), name='scan_qr_api'),
-    path('api/checkin/', views.CheckinAPIView.as_view(), name='checkin_api'),
+    path('<int:pk>/live/', views.EventStreamView.as_view(), name='event_stream'),
+    path('<int:pk>/roster/', roster_view.as_view(), name='roster_snapshot'),
+    path('api/scan/', scan_view.as_view(), name='scan_qr_api'),
+    path('api/checkin/', checkin_view.as_view(), name='checkin_api'),
+    path('api/checkin/batch/', views.BatchCheckinAPIView.as_view(), name='batch_checkin_api'),
 ]
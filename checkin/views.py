@@ -1,13 +1,23 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
 from django.views import View
-from django.http import JsonResponse
-from django.utils import timezone
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
 import json
-import uuid
+import time
 
 from events.models import Event, Registration
+from events.qr_payload import InvalidPayload, SignedPayload, parse_payload, payload_signature
+
+from . import ledger, live, roster
+from .attendance import check_in, check_in_many
+from .broker import RESYNC, get_broker
+from .idempotency import IdempotentMixin
 
 class CheckinHomeView(LoginRequiredMixin, ListView):
     model = Event
@@ -25,39 +35,236 @@ class QRScannerView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Event.objects.filter(organizer=self.request.user)
 
-class ScanQRCodeAPIView(LoginRequiredMixin, View):
+    def get_context_data(self, **kwargs):
+        # Opening the scanner means the event is live: serve its scans from the hot roster
+        roster.start_warming(self.object)
+        return super().get_context_data(**kwargs)
+
+def scan_error(message, status, outcome):
+    """Error response tagged with its scan ledger outcome"""
+    response = JsonResponse({'error': message}, status=status)
+    response.scan_outcome = outcome
+    return response
+
+def scanner_source(request, data):
+    """Gate and device reported by the scanner, from the JSON body or X-Checkin-* headers"""
+    return {
+        'gate': str(data.get('gate') or request.headers.get('X-Checkin-Gate', '')),
+        'device': str(data.get('device') or request.headers.get('X-Checkin-Device', '')),
+    }
+
+def requested_event_id(data):
+    try:
+        return int(data['event_id']) if data.get('event_id') else None
+    except (TypeError, ValueError):
+        return None
+
+def elapsed_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+def parse_scan_request(data):
+    """Validate the QR payload and scanner event of a scan request.
+
+    Returns ``(payload, event_id, None)`` or ``(None, None, error_response)``;
+    signed payloads for another event are rejected here, without a query.
+    """
+    qr_code = data.get('qr_code')
+    
+    if not qr_code:
+        return None, None, scan_error('QR code is required', 400, 'invalid')
+    
+    # Parse signed tokens or legacy UUID payloads
+    try:
+        payload = parse_payload(qr_code)
+    except InvalidPayload as e:
+        return None, None, scan_error(str(e), 400, 'invalid')
+    
+    # Event the scanner is checking people into (optional for older clients)
+    try:
+        event_id = int(data['event_id']) if data.get('event_id') else None
+    except (TypeError, ValueError):
+        return None, None, scan_error('Invalid event ID', 400, 'invalid')
+    
+    # Verified offline: wrong-event codes never reach the database
+    if isinstance(payload, SignedPayload) and event_id is not None and payload.event_id != event_id:
+        return None, None, scan_error('QR code belongs to a different event', 400, 'wrong_event')
+    
+    return payload, event_id, None
+
+def roster_query(payload, event_id):
+    """Keyword arguments for ``roster.lookup()``, or None when the hot roster can't answer"""
+    if isinstance(payload, SignedPayload):
+        return {'event_id': payload.event_id, 'registration_id': payload.registration_id}
+    if event_id is not None:
+        return {'event_id': event_id, 'unique_id': payload.unique_id}
+    return None
+
+def registration_lookup(payload):
+    if isinstance(payload, SignedPayload):
+        return {'pk': payload.registration_id, 'event_id': payload.event_id}
+    return {'unique_id': payload.unique_id}
+
+def check_scanned_registration(registration, event_id, user):
+    """Error response if the scanned registration is not the user's or not for the scanner's event"""
+    if registration.event.organizer_id != user.id:
+        return scan_error('Unauthorized', 403, 'unauthorized')
+    if event_id is not None and registration.event_id != event_id:
+        return scan_error('QR code belongs to a different event', 400, 'wrong_event')
+    return None
+
+def find_scanned_registration(data, user):
+    """Resolve a scanned QR payload to a registration of one of the user's events.
+
+    Returns ``(registration, None)`` or ``(None, error_response)``. Scans for a
+    warm event are answered from the hot roster; otherwise the event is fetched
+    in the same query. Error responses carry a ``scan_outcome`` for the ledger.
+    """
+    payload, event_id, error = parse_scan_request(data)
+    if error:
+        return None, error
+    
+    # Find registration: hot roster first, then the database
+    query = roster_query(payload, event_id)
+    registration = roster.lookup(**query) if query else None
+    if registration is None:
+        try:
+            registration = Registration.objects.select_related('event').get(**registration_lookup(payload))
+        except Registration.DoesNotExist:
+            return None, scan_error('Registration not found', 404, 'not_found')
+        if registration.event_id == event_id:
+            roster.remember(registration)
+    
+    error = check_scanned_registration(registration, event_id, user)
+    if error:
+        return None, error
+    return registration, None
+
+def registration_details(registration):
+    return {
+        'registration_id': registration.id,
+        'participant_name': registration.participant_name,
+        'participant_email': registration.participant_email,
+        'event_name': registration.event.name,
+        'status': registration.status,
+        'registered_at': registration.registered_at.isoformat(),
+        'attended_at': registration.attended_at.isoformat() if registration.attended_at else None,
+    }
+
+def publish_check_in(registration, attended_at, previous_status):
+    live.publish_check_ins(registration.event_id, [{
+        'registration_id': registration.pk,
+        'participant_name': registration.participant_name,
+        'attended_at': attended_at,
+        'previous_status': previous_status,
+    }])
+
+def scan_check_in_response(registration, checked_in, previous_status):
+    response = registration_details(registration)
+    response.update({
+        'checked_in': checked_in,
+        # Lets the scanner move its live counters without waiting for the stream
+        'previous_status': previous_status if checked_in else None,
+        'already_checked_in': not checked_in,
+        'message': (
+            f'{registration.participant_name} checked in successfully' if checked_in
+            else f'{registration.participant_name} is already checked in'
+        ),
+    })
+    return JsonResponse(response)
+
+class ScanQRCodeAPIView(LoginRequiredMixin, IdempotentMixin, View):
+    """Look up a scanned QR code.
+
+    With ``"mode": "checkin"`` the registration is also checked in within the
+    same request, so scanners need one round trip instead of scan + confirm.
+    """
+
     def post(self, request):
+        started = time.monotonic()
         try:
             data = json.loads(request.body)
-            qr_code = data.get('qr_code')
+            registration, error = find_scanned_registration(data, request.user)
+            action = 'checkin' if data.get('mode') == 'checkin' else 'lookup'
+            source = scanner_source(request, data)
+            if error:
+                ledger.record(action, error.scan_outcome, event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return error
             
-            if not qr_code:
-                return JsonResponse({'error': 'QR code is required'}, status=400)
+            if action == 'lookup':
+                ledger.record(action, 'found', event_id=registration.event_id, registration_id=registration.pk,
+                              user=request.user, latency_ms=elapsed_ms(started), **source)
+                return JsonResponse(registration_details(registration))
             
-            # Try to parse the QR code as UUID
-            try:
-                unique_id = uuid.UUID(qr_code)
-            except ValueError:
-                return JsonResponse({'error': 'Invalid QR code format'}, status=400)
+            previous_status = registration.status
+            attended_at = check_in(registration.pk, registration.event_id)
+            checked_in = attended_at is not None
+            if checked_in:
+                publish_check_in(registration, attended_at, previous_status)
+                registration.status = 'attended'
+                registration.attended_at = attended_at
+            elif registration.status != 'attended':
+                # Another gate won the race; report its check-in time
+                registration.refresh_from_db(fields=['status', 'attended_at'])
             
-            # Find registration
-            try:
-                registration = Registration.objects.get(unique_id=unique_id)
-            except Registration.DoesNotExist:
+            ledger.record(action, 'checked_in' if checked_in else 'already_checked_in',
+                          event_id=registration.event_id, registration_id=registration.pk,
+                          user=request.user, latency_ms=elapsed_ms(started), **source)
+            return scan_check_in_response(registration, checked_in, previous_status)
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+class CheckinAPIView(LoginRequiredMixin, IdempotentMixin, View):
+    def post(self, request):
+        started = time.monotonic()
+        try:
+            data = json.loads(request.body)
+            registration_id = data.get('registration_id')
+            source = scanner_source(request, data)
+            
+            if not registration_id:
+                ledger.record('checkin', 'invalid', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
+                return JsonResponse({'error': 'Registration ID is required'}, status=400)
+            
+            # Narrow read for the ownership check; no row lock and no full-row save
+            registration = Registration.objects.filter(pk=registration_id).values(
+                'participant_name', 'status', 'event_id', 'event__organizer_id'
+            ).first()
+            if registration is None:
+                ledger.record('checkin', 'not_found', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
                 return JsonResponse({'error': 'Registration not found'}, status=404)
             
             # Check if user is organizer
-            if registration.event.organizer != request.user:
+            if registration['event__organizer_id'] != request.user.id:
+                ledger.record('checkin', 'unauthorized', event_id=requested_event_id(data), user=request.user,
+                              latency_ms=elapsed_ms(started), **source)
                 return JsonResponse({'error': 'Unauthorized'}, status=403)
             
+            # The affected-row count of the conditional UPDATE decides the outcome
+            attended_at = check_in(registration_id, registration['event_id'])
+            ledger.record('checkin', 'checked_in' if attended_at else 'already_checked_in',
+                          event_id=registration['event_id'], registration_id=int(registration_id),
+                          user=request.user, latency_ms=elapsed_ms(started), **source)
+            if attended_at is None:
+                return JsonResponse({'error': 'Already checked in'}, status=400)
+            live.publish_check_ins(registration['event_id'], [{
+                'registration_id': int(registration_id),
+                'participant_name': registration['participant_name'],
+                'attended_at': attended_at,
+                'previous_status': registration['status'],
+            }])
+            
             return JsonResponse({
-                'registration_id': registration.id,
-                'participant_name': registration.participant_name,
-                'participant_email': registration.participant_email,
-                'event_name': registration.event.name,
-                'status': registration.status,
-                'registered_at': registration.registered_at.isoformat(),
-                'attended_at': registration.attended_at.isoformat() if registration.attended_at else None,
+                'success': True,
+                'message': f'{registration["participant_name"]} checked in successfully',
+                'participant_name': registration['participant_name'],
+                'attended_at': attended_at.isoformat(),
+                'previous_status': registration['status'],
             })
             
         except json.JSONDecodeError:
@@ -65,43 +272,277 @@ class ScanQRCodeAPIView(LoginRequiredMixin, View):
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
-class CheckinAPIView(LoginRequiredMixin, View):
+class BatchCheckinAPIView(LoginRequiredMixin, IdempotentMixin, View):
+    """Apply scans queued by offline scanners in one transaction.
+
+    Body: ``{"event_id": 1, "scans": [{"qr_code": "...", "scanned_at": "<ISO 8601>"}, ...]}``
+    where each scan may carry ``registration_id`` instead of ``qr_code``. Every
+    scan gets its own result and the client scan time is stored as
+    ``attended_at``; when a badge appears twice, the earliest scan wins.
+    """
+    max_scans = 500
+
     def post(self, request):
+        started = time.monotonic()
         try:
             data = json.loads(request.body)
-            registration_id = data.get('registration_id')
+            scans = data.get('scans')
             
-            if not registration_id:
-                return JsonResponse({'error': 'Registration ID is required'}, status=400)
+            if not isinstance(scans, list) or not scans:
+                return JsonResponse({'error': 'Scans are required'}, status=400)
+            if len(scans) > self.max_scans:
+                return JsonResponse({'error': f'At most {self.max_scans} scans per batch'}, status=400)
             
-            # Find registration
             try:
-                registration = Registration.objects.get(id=registration_id)
-            except Registration.DoesNotExist:
-                return JsonResponse({'error': 'Registration not found'}, status=404)
+                event_id = int(data['event_id']) if data.get('event_id') else None
+            except (TypeError, ValueError):
+                return JsonResponse({'error': 'Invalid event ID'}, status=400)
             
-            # Check if user is organizer
-            if registration.event.organizer != request.user:
-                return JsonResponse({'error': 'Unauthorized'}, status=403)
+            now = timezone.now()
+            results = [None] * len(scans)
+            parsed = []
+            for index, scan in enumerate(scans):
+                lookup, scanned_at, error = self.parse_scan(scan, event_id, now)
+                if error:
+                    results[index] = {'index': index, 'result': 'invalid', 'error': error}
+                else:
+                    parsed.append((scanned_at, index, lookup))
             
-            # Update status
-            if registration.status == 'attended':
-                return JsonResponse({'error': 'Already checked in'}, status=400)
+            lookups = [lookup for _, _, lookup in parsed]
+            ids = {value for kind, value in lookups if kind == 'pk'}
+            unique_ids = {value for kind, value in lookups if kind == 'unique_id'}
             
-            registration.status = 'attended'
-            registration.attended_at = timezone.now()
-            registration.save()
+            with transaction.atomic():
+                rows = list(
+                    Registration.objects.select_for_update()
+                    .filter(Q(pk__in=ids) | Q(unique_id__in=unique_ids))
+                    .values('id', 'unique_id', 'event_id', 'status', 'attended_at', 'participant_name')
+                )
+                owned_events = set(
+                    Event.objects.filter(organizer=request.user, pk__in={row['event_id'] for row in rows})
+                    .values_list('pk', flat=True)
+                )
+                by_key = {}
+                for row in rows:
+                    by_key[('pk', row['id'])] = row
+                    by_key[('unique_id', row['unique_id'])] = row
+                
+                # Earliest scan of each badge wins; later ones are reported as duplicates
+                to_check_in = {}
+                for scanned_at, index, lookup in sorted(parsed, key=lambda item: (item[0], item[1])):
+                    results[index] = self.classify(index, by_key.get(lookup), scanned_at, event_id, owned_events, to_check_in)
+                
+                check_in_many(to_check_in)
+                
+                # Published once the transaction commits
+                check_ins_by_event = {}
+                for registration_id, attended_at in to_check_in.items():
+                    row = by_key[('pk', registration_id)]
+                    check_ins_by_event.setdefault(row['event_id'], []).append({
+                        'registration_id': registration_id,
+                        'participant_name': row['participant_name'],
+                        'attended_at': attended_at,
+                        'previous_status': row['status'],
+                    })
+                for registration_event_id, check_ins in check_ins_by_event.items():
+                    live.publish_check_ins(registration_event_id, check_ins)
             
+            self.record_results(request, data, results, parsed, event_id, now, elapsed_ms(started))
             return JsonResponse({
-                'success': True,
-                'message': f'{registration.participant_name} checked in successfully',
-                'attended_at': registration.attended_at.isoformat(),
+                'results': results,
+                'total': len(results),
+                'checked_in': len(to_check_in),
             })
             
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
+    
+    def record_results(self, request, data, results, parsed, event_id, now, latency_ms):
+        """Add every scan of the batch to the ledger at the time and gate it was scanned"""
+        batch_source = scanner_source(request, data)
+        scanned_at_by_index = {index: scanned_at for scanned_at, index, _ in parsed}
+        for result, scan in zip(results, data['scans']):
+            source = dict(batch_source)
+            if isinstance(scan, dict):
+                source.update({key: str(scan[key]) for key in ('gate', 'device') if scan.get(key)})
+            ledger.record(
+                'batch', result['result'],
+                event_id=event_id,
+                registration_id=result.get('registration_id'),
+                user=request.user,
+                latency_ms=latency_ms,
+                occurred_at=scanned_at_by_index.get(result['index'], now),
+                **source,
+            )
+    
+    def parse_scan(self, scan, event_id, now):
+        """Return ``(lookup, scanned_at, error)`` for one queued scan"""
+        if not isinstance(scan, dict):
+            return None, None, 'Scan must be an object'
+        
+        scanned_at = now
+        if scan.get('scanned_at'):
+            try:
+                scanned_at = parse_datetime(str(scan['scanned_at']))
+            except ValueError:
+                scanned_at = None
+            if scanned_at is None:
+                return None, None, 'Invalid scanned_at'
+            if timezone.is_naive(scanned_at):
+                scanned_at = timezone.make_aware(scanned_at)
+            # Never trust a scanner clock that runs ahead of the server
+            scanned_at = min(scanned_at, now)
+        
+        if scan.get('registration_id'):
+            try:
+                return ('pk', int(scan['registration_id'])), scanned_at, None
+            except (TypeError, ValueError):
+                return None, None, 'Invalid registration ID'
+        
+        try:
+            payload = parse_payload(scan.get('qr_code') or scan.get('unique_id'))
+        except InvalidPayload as e:
+            return None, None, str(e)
+        if isinstance(payload, SignedPayload):
+            if event_id is not None and payload.event_id != event_id:
+                return None, None, 'QR code belongs to a different event'
+            return ('pk', payload.registration_id), scanned_at, None
+        return ('unique_id', payload.unique_id), scanned_at, None
+    
+    def classify(self, index, row, scanned_at, event_id, owned_events, to_check_in):
+        if row is None:
+            return {'index': index, 'result': 'not_found'}
+        
+        result = {
+            'index': index,
+            'registration_id': row['id'],
+            'unique_id': str(row['unique_id']),
+            'participant_name': row['participant_name'],
+        }
+        if row['event_id'] not in owned_events:
+            return {'index': index, 'result': 'unauthorized'}
+        if event_id is not None and row['event_id'] != event_id:
+            result['result'] = 'wrong_event'
+        elif row['status'] == 'attended':
+            result['result'] = 'already_checked_in'
+            result['attended_at'] = row['attended_at'].isoformat() if row['attended_at'] else None
+        elif row['id'] in to_check_in:
+            result['result'] = 'duplicate'
+            result['attended_at'] = to_check_in[row['id']].isoformat()
+        else:
+            to_check_in[row['id']] = scanned_at
+            result['result'] = 'checked_in'
+            result['attended_at'] = scanned_at.isoformat()
+        return result
+
+class EventStreamView(View):
+    """Server-sent events with live counters and recent check-ins of one event.
+
+    Under ASGI the response stays open and relays broker messages, closing
+    after ``max_duration`` so EventSource reconnects with fresh counters.
+    Under WSGI (Passenger) it sends the current counters once and asks the
+    client to reconnect after ``poll_retry`` milliseconds instead.
+    """
+    keepalive = 15
+    max_duration = 300
+    reconnect_retry = 2000
+    poll_retry = 30000
+
+    async def get(self, request, pk):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if not await Event.objects.filter(pk=pk, organizer=user).aexists():
+            return JsonResponse({'error': 'Event not found'}, status=404)
+        
+        if isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(self.stream(pk), content_type='text/event-stream')
+        else:
+            counters = await live.acounters(pk)
+            response = HttpResponse(
+                live.sse_message('counters', counters, retry=self.poll_retry),
+                content_type='text/event-stream',
+            )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    async def stream(self, event_id):
+        broker = get_broker()
+        channel = live.channel_name(event_id)
+        # Subscribe before reading the counters so no delta falls in between
+        subscription = broker.subscribe(channel)
+        try:
+            yield live.sse_message('counters', await live.acounters(event_id), retry=self.reconnect_retry)
+            recent = broker.recent(channel)
+            if recent:
+                yield live.sse_message('recent', {'check_ins': recent})
+            
+            deadline = subscription.loop.time() + self.max_duration
+            while subscription.loop.time() < deadline:
+                message = await subscription.get(self.keepalive)
+                if message is None:
+                    yield ': keepalive\n\n'
+                elif message is RESYNC:
+                    yield live.sse_message('counters', await live.acounters(event_id))
+                else:
+                    yield live.sse_message(message['type'], message)
+        finally:
+            subscription.close()
+
+class RosterSnapshotAPIView(LoginRequiredMixin, View):
+    """Compact, versioned roster of one event for offline scanners.
+
+    ``GET ?since=<version>`` returns only registrations changed since that
+    cursor. Each snapshot overlaps the previous one by ``overlap`` so rows
+    committed late are not missed; clients upsert entries by unique_id. Each
+    entry carries the signature of the registration's signed QR token, so
+    scanners can reject forged tokens while offline.
+    """
+    fields = ['unique_id', 'registration_id', 'participant_name', 'status', 'signature']
+    overlap = timedelta(seconds=10)
+
+    def get(self, request, pk):
+        if not Event.objects.filter(pk=pk, organizer=request.user).exists():
+            return JsonResponse({'error': 'Event not found'}, status=404)
+        
+        registrations, since, error = self.changed_registrations(request, pk)
+        if error:
+            return error
+        
+        # Taken before the query so concurrent writes land in the next delta
+        version = timezone.now() - self.overlap
+        entries = [self.entry(pk, *row) for row in registrations.iterator(chunk_size=2000)]
+        return self.snapshot_response(pk, version, since, entries)
+    
+    def entry(self, pk, unique_id, registration_id, name, status):
+        return [str(unique_id), registration_id, name, status, payload_signature(pk, registration_id)]
+    
+    def changed_registrations(self, request, pk):
+        """Roster rows changed since the ``since`` cursor: ``(queryset, since, error_response)``"""
+        since = request.GET.get('since')
+        registrations = Registration.objects.filter(event_id=pk)
+        if since:
+            try:
+                # A "+00:00" offset arrives as " 00:00" when the client forgets to encode it
+                since = parse_datetime(since.replace(' ', '+'))
+            except ValueError:
+                since = None
+            if since is None:
+                return None, None, JsonResponse({'error': 'Invalid version cursor'}, status=400)
+            registrations = registrations.filter(updated_at__gte=since)
+        return registrations.order_by().values_list('unique_id', 'id', 'participant_name', 'status'), since, None
+    
+    def snapshot_response(self, pk, version, since, entries):
+        return JsonResponse({
+            'event_id': pk,
+            'version': version.isoformat(),
+            'full': not since,
+            'fields': self.fields,
+            'entries': entries,
+        })
 
 class ParticipantListView(LoginRequiredMixin, ListView):
     model = Registration
@@ -7,7 +7,8 @@ from django.db import transaction
 
 from .models import UserProfile
 from .forms import UserProfileForm, UserForm
-from events.models import Event, Registration
+from events.models import Event
+from events.stats import organizer_stats
 
 class UserProfileView(LoginRequiredMixin, DetailView):
     model = UserProfile
@@ -22,24 +23,15 @@ class UserProfileView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         user = self.request.user
         
-        # Get user's events
-        user_events = Event.objects.filter(organizer=user).order_by('-created_at')
-        
-        # Get statistics
-        total_events = user_events.count()
-        total_participants = Registration.objects.filter(event__organizer=user).count()
-        total_attended = Registration.objects.filter(event__organizer=user, status='attended').count()
-        
-        # Get recent events (last 5)
-        recent_events = user_events[:5]
+        # Totals come from one cached aggregate over the event counter columns
+        stats = organizer_stats(user)
+        recent_events = Event.objects.filter(organizer=user).order_by('-created_at')[:5]
         
         # Mock recent activity (in a real app, you'd have an Activity model)
         recent_activity = []
         
         context.update({
-            'total_events': total_events,
-            'total_participants': total_participants,
-            'total_attended': total_attended,
+            **stats,
             'recent_events': recent_events,
             'recent_activity': recent_activity,
         })
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'event_registration_attendance.settings')
+# Serve the scanner APIs with async views so slow clients don't each hold a thread
+os.environ.setdefault('CHECKIN_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
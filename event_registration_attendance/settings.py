@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -89,6 +90,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'event-registration',
+        # The check-in roster takes two keys per registration; Django's default is 300
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -139,6 +153,14 @@ DEFAULT_FROM_EMAIL = 'noreply@eventregistration.local'
 # EMAIL_HOST_USER = 'your-email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'your-app-password'
 
+# Confirmation emails go through the outbox (events.outbox): 'sync' still sends each one
+# right after the request's transaction commits, 'outbox' leaves them to
+# `manage.py send_outbox --loop`, which reuses one SMTP connection
+EMAIL_DELIVERY_MODE = 'sync'
+# Outbox sending rate (0 = unlimited) and attempts before an email is marked failed
+EMAIL_OUTBOX_MAX_PER_MINUTE = 0
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+
 # Login URLs
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = '/events/'
@@ -150,6 +172,47 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # QR Code settings
 QR_CODE_DIR = 'qr_codes'
+# Upper bound (bytes) for the in-process LRU of rendered registration QR images
+QR_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# 'sync' renders QR images inside the registration request, 'deferred' leaves them
+# pending for `manage.py process_qr_queue` and renders on demand when viewed
+QR_GENERATION_MODE = 'sync'
+# 'uuid' encodes the bare registration UUID; 'signed' encodes a compact HMAC token
+# (event id, registration id) that scanners verify before any database lookup.
+# Legacy UUID codes keep scanning in either mode.
+QR_PAYLOAD_FORMAT = 'uuid'
+
+# Registration intake: 'direct' writes each registration inside its request; 'spool'
+# appends validated submissions to a local SQLite spool and acknowledges at once,
+# for `manage.py drain_registration_spool --loop` (same host) to write in batches
+REGISTRATION_INTAKE_MODE = 'direct'
+REGISTRATION_SPOOL_PATH = BASE_DIR / 'registration_spool.sqlite3'
+
+# Check-in roster cache: seconds a warmed event roster stays in the shared cache,
+# seconds entries are reused from process memory before re-reading the cache,
+# and how many entries each process keeps in memory
+CHECKIN_ROSTER_TIMEOUT = 6 * 60 * 60
+CHECKIN_ROSTER_LOCAL_TTL = 5
+CHECKIN_ROSTER_LOCAL_MAX = 5000
+
+# Live counters (/checkin/<event>/live/): the local broker is in-process, so
+# stream under a single ASGI worker; WSGI deployments fall back to polling
+CHECKIN_BROKER = 'checkin.broker.LocalBroker'
+
+# Scan ledger: entries are buffered per process and written with one bulk insert
+# once this many are pending or the oldest is this many seconds old
+CHECKIN_LEDGER_BATCH_SIZE = 200
+CHECKIN_LEDGER_FLUSH_INTERVAL = 5
+
+# Upper bound (seconds) on cached profile dashboard totals; writes invalidate them earlier
+ORGANIZER_STATS_TIMEOUT = 15 * 60
+
+# Seconds check-in responses are kept for replay to retries with the same Idempotency-Key
+CHECKIN_IDEMPOTENCY_TIMEOUT = 10 * 60
+
+# Route the scan, check-in and roster APIs to their async views; asgi.py turns this
+# on, Passenger/WSGI keeps the sync views
+CHECKIN_ASYNC_VIEWS = os.environ.get('CHECKIN_ASYNC_VIEWS', '0') == '1'
 
 # Security settings for development
 SECURE_BROWSER_XSS_FILTER = True
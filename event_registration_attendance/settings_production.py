@@ -110,6 +110,18 @@ else:
         }
     }
 
+# Cache
+# File-based by default so memoized values (e.g. event QR codes) are shared by
+# every Passenger process on shared hosting; point CACHE_BACKEND/CACHE_LOCATION
+# at memcached or redis when available. The check-in roster (checkin.roster)
+# is only used with a shared in-memory backend like those.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -157,6 +169,11 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', 'admin@event.parokibintaro.o
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', 'your-email-password')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Event Registration Paroki Bintaro <admin@event.parokibintaro.org>')
 
+# Outbox delivery: run `manage.py send_outbox --loop`; keep the rate under the mail host's limits
+EMAIL_DELIVERY_MODE = os.environ.get('EMAIL_DELIVERY_MODE', 'outbox')
+EMAIL_OUTBOX_MAX_PER_MINUTE = int(os.environ.get('EMAIL_OUTBOX_MAX_PER_MINUTE', 20))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+
 # Login URLs
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = '/events/'
@@ -167,6 +184,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # QR Code settings
 QR_CODE_DIR = 'qr_codes'
+# Upper bound (bytes) for the in-process LRU of rendered registration QR images
+QR_CACHE_MAX_BYTES = int(os.environ.get('QR_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+# 'sync' renders QR images inside the registration request, 'deferred' leaves them
+# pending for `manage.py process_qr_queue` and renders on demand when viewed
+QR_GENERATION_MODE = os.environ.get('QR_GENERATION_MODE', 'sync')
+# 'uuid' encodes the bare registration UUID; 'signed' encodes a compact HMAC token
+# (event id, registration id) that scanners verify before any database lookup.
+# Legacy UUID codes keep scanning in either mode.
+QR_PAYLOAD_FORMAT = os.environ.get('QR_PAYLOAD_FORMAT', 'uuid')
+
+# Registration intake: 'direct' or 'spool' (surges; run `manage.py drain_registration_spool --loop`
+# on the web host, since the spool is a local SQLite file)
+REGISTRATION_INTAKE_MODE = os.environ.get('REGISTRATION_INTAKE_MODE', 'direct')
+REGISTRATION_SPOOL_PATH = os.environ.get('REGISTRATION_SPOOL_PATH', str(BASE_DIR / 'registration_spool.sqlite3'))
+
+# Check-in roster cache (shared cache timeout / in-process TTL, seconds)
+CHECKIN_ROSTER_TIMEOUT = int(os.environ.get('CHECKIN_ROSTER_TIMEOUT', 6 * 60 * 60))
+CHECKIN_ROSTER_LOCAL_TTL = int(os.environ.get('CHECKIN_ROSTER_LOCAL_TTL', 5))
+CHECKIN_ROSTER_LOCAL_MAX = int(os.environ.get('CHECKIN_ROSTER_LOCAL_MAX', 5000))
+
+# Live counters (/checkin/<event>/live/): the local broker is in-process, so
+# stream under a single ASGI worker; WSGI deployments fall back to polling
+CHECKIN_BROKER = 'checkin.broker.LocalBroker'
+
+# Scan ledger: entries are buffered per process and bulk-written after responses
+CHECKIN_LEDGER_BATCH_SIZE = int(os.environ.get('CHECKIN_LEDGER_BATCH_SIZE', 200))
+CHECKIN_LEDGER_FLUSH_INTERVAL = int(os.environ.get('CHECKIN_LEDGER_FLUSH_INTERVAL', 5))
+
+# Upper bound (seconds) on cached profile dashboard totals; writes invalidate them earlier
+ORGANIZER_STATS_TIMEOUT = int(os.environ.get('ORGANIZER_STATS_TIMEOUT', 15 * 60))
+
+# Seconds check-in responses are kept for replay to retries with the same Idempotency-Key
+CHECKIN_IDEMPOTENCY_TIMEOUT = int(os.environ.get('CHECKIN_IDEMPOTENCY_TIMEOUT', 10 * 60))
+
+# Route the scan, check-in and roster APIs to their async views; asgi.py turns this
+# on, Passenger/WSGI keeps the sync views
+CHECKIN_ASYNC_VIEWS = os.environ.get('CHECKIN_ASYNC_VIEWS', '0') == '1'
 
 # Security settings for production
 # Temporarily disable strict HTTPS settings for initial deployment
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Event, EventField, Registration, RegistrationFormFieldData
+from django.utils import timezone
+from .models import Event, EventField, OutgoingEmail, Registration, RegistrationFormFieldData
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -10,8 +11,9 @@ class EventAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     
     def total_registrations(self, obj):
-        return obj.total_registrations
+        return obj.registration_count
     total_registrations.short_description = 'Registrations'
+    total_registrations.admin_order_field = 'registration_count'
 
 @admin.register(EventField)
 class EventFieldAdmin(admin.ModelAdmin):
@@ -39,3 +41,17 @@ class RegistrationFormFieldDataAdmin(admin.ModelAdmin):
     def field_value_short(self, obj):
         return obj.field_value[:50] + "..." if len(obj.field_value) > 50 else obj.field_value
     field_value_short.short_description = 'Field Value'
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['recipient', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['recipient', 'subject']
+    readonly_fields = ['registration', 'recipient', 'subject', 'body', 'from_email', 'attempts',
+                       'last_error', 'created_at', 'sent_at']
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} email(s) queued for sending.')
+    retry_now.short_description = 'Send again now'
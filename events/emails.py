@@ -0,0 +1,24 @@
+from .outbox import queue_email
+
+
+def queue_registration_confirmation(registration, qr_code_url):
+    """Queue the participant's confirmation email with their QR code link in the outbox"""
+    subject = f'Registration Confirmation - {registration.event.name}'
+    message = f'''
+    Dear {registration.participant_name},
+    
+    Thank you for registering for {registration.event.name}!
+    
+    Event Details:
+    - Date: {registration.event.start_date}
+    - Time: {registration.event.start_time}
+    - Location: {registration.event.location}
+    
+    Your QR Code: {qr_code_url}
+    
+    Please bring this QR code to the event for check-in.
+    
+    Best regards,
+    {registration.event.organizer.get_full_name() or registration.event.organizer.username}
+    '''
+    return queue_email(registration.participant_email, subject, message, registration=registration)
@@ -0,0 +1,142 @@
+"""Compiled registration form schemas
+
+An event's custom fields are compiled into a tuple of immutable ``FieldSpec``
+rows with their choices already parsed. Specs are cached in the shared cache
+under the event's ``form_version``, which every EventField write bumps, so a
+cached schema never needs invalidating: edits simply move readers to a new
+key. Each process additionally keeps the Django form fields built from a
+schema, and ``DynamicRegistrationForm`` copies those instead of querying
+``event.fields`` and rebuilding widgets on every request.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+from django import forms
+from django.core.cache import cache
+
+FieldSpec = namedtuple('FieldSpec', [
+    'id', 'name', 'field_type', 'required', 'help_text', 'placeholder', 'choices',
+    'is_participant_name', 'is_participant_email', 'is_participant_phone',
+])
+
+SPEC_FIELDS = ['id', 'field_name', 'field_type', 'is_required', 'help_text', 'placeholder', 'choices',
+               'is_participant_name', 'is_participant_email', 'is_participant_phone']
+
+# Old versions are never read again once an event's form changes
+SCHEMA_TIMEOUT = 24 * 60 * 60
+
+def _schema_key(event_id, version):
+    return f'events:form-schema:{event_id}:{version}'
+
+def field_key(spec):
+    """Form field name of a spec in DynamicRegistrationForm"""
+    return f'field_{spec.id}'
+
+def compile_schema(event_id):
+    """Read an event's fields in form order with one query"""
+    from .models import EventField
+
+    rows = EventField.objects.filter(event_id=event_id).order_by('order', 'id').values_list(*SPEC_FIELDS)
+    schema = []
+    for pk, name, field_type, required, help_text, placeholder, choices, *identifiers in rows:
+        parsed = tuple(choice.strip() for choice in choices.split('\n') if choice.strip()) if choices else ()
+        schema.append(FieldSpec(pk, name, field_type, required, help_text, placeholder, parsed, *identifiers))
+    return tuple(schema)
+
+def get_schema(event):
+    """Compiled schema of an event, read from the shared cache when possible"""
+    key = _schema_key(event.pk, event.form_version)
+    schema = cache.get(key)
+    if schema is None:
+        schema = compile_schema(event.pk)
+        cache.set(key, schema, timeout=SCHEMA_TIMEOUT)
+    return schema
+
+def _attrs(spec, **attrs):
+    attrs = {'class': 'form-control', **attrs}
+    if spec.placeholder:
+        attrs['placeholder'] = spec.placeholder
+    return attrs
+
+def build_field(spec):
+    """Django form field for one spec; None for unknown field types"""
+    kwargs = {'required': spec.required, 'label': spec.name, 'help_text': spec.help_text}
+    choices = [(choice, choice) for choice in spec.choices]
+
+    if spec.field_type == 'text':
+        return forms.CharField(widget=forms.TextInput(attrs=_attrs(spec)), **kwargs)
+    if spec.field_type == 'email':
+        return forms.EmailField(widget=forms.EmailInput(attrs=_attrs(spec)), **kwargs)
+    if spec.field_type == 'number':
+        return forms.IntegerField(widget=forms.NumberInput(attrs=_attrs(spec)), **kwargs)
+    if spec.field_type == 'date':
+        return forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}), **kwargs)
+    if spec.field_type == 'textarea':
+        return forms.CharField(widget=forms.Textarea(attrs=_attrs(spec, rows=4)), **kwargs)
+    if spec.field_type == 'phone':
+        return forms.CharField(max_length=20, widget=forms.TextInput(attrs=_attrs(spec, type='tel')), **kwargs)
+    if spec.field_type == 'radio':
+        return forms.ChoiceField(choices=choices, widget=forms.RadioSelect(attrs={'class': 'form-check-input'}),
+                                 **kwargs)
+    if spec.field_type == 'select':
+        return forms.ChoiceField(choices=[('', '-- Select --')] + choices,
+                                 widget=forms.Select(attrs={'class': 'form-control'}), **kwargs)
+    if spec.field_type == 'checkbox':
+        return forms.MultipleChoiceField(choices=choices,
+                                         widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
+                                         **kwargs)
+    if spec.field_type == 'file':
+        return forms.FileField(widget=forms.FileInput(attrs={'class': 'form-control'}), **kwargs)
+    return None
+
+def participant_fields(schema, values):
+    """participant_name/email/phone derived from submitted values, as Registration.update_cached_fields() does
+
+    ``values`` maps field ids to the stored (string) values.
+    """
+    derived = {}
+    name_specs = [spec for spec in schema if spec.is_participant_name]
+    if name_specs:
+        derived['participant_name'] = ' '.join(values[spec.id] for spec in name_specs if spec.id in values)
+    for attr, flag in (('participant_email', 'is_participant_email'), ('participant_phone', 'is_participant_phone')):
+        for spec in schema:
+            if getattr(spec, flag) and spec.id in values:
+                derived[attr] = values[spec.id]
+                break
+    return derived
+
+class CompiledForms:
+    """Per-process LRU of built form fields, keyed by (event id, form version)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, event):
+        key = (event.pk, event.form_version)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+
+        schema = get_schema(event)
+        fields = {}
+        for spec in schema:
+            field = build_field(spec)
+            if field is not None:
+                fields[field_key(spec)] = field
+        compiled = (schema, fields)
+
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+compiled_forms = CompiledForms()
@@ -1,5 +1,8 @@
 from django import forms
+from django.db import transaction
+from .form_schema import compiled_forms, field_key, participant_fields
 from .models import Event, EventField, Registration, RegistrationFormFieldData
+import copy
 import json
 
 class EventForm(forms.ModelForm):
@@ -54,97 +57,36 @@ class DynamicRegistrationForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.event = event
         
-        for field in event.fields.all().order_by('order', 'id'):
-            field_kwargs = {
-                'required': field.is_required,
-                'label': field.field_name,
-                'help_text': field.help_text,
-            }
-            
-            # Handle widgets based on field type and placeholder
-            if field.field_type == 'text':
-                if field.placeholder:
-                    field_kwargs['widget'] = forms.TextInput(attrs={'class': 'form-control', 'placeholder': field.placeholder})
-                else:
-                    field_kwargs['widget'] = forms.TextInput(attrs={'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.CharField(**field_kwargs)
-                
-            elif field.field_type == 'email':
-                if field.placeholder:
-                    field_kwargs['widget'] = forms.EmailInput(attrs={'class': 'form-control', 'placeholder': field.placeholder})
-                else:
-                    field_kwargs['widget'] = forms.EmailInput(attrs={'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.EmailField(**field_kwargs)
-                
-            elif field.field_type == 'number':
-                if field.placeholder:
-                    field_kwargs['widget'] = forms.NumberInput(attrs={'class': 'form-control', 'placeholder': field.placeholder})
-                else:
-                    field_kwargs['widget'] = forms.NumberInput(attrs={'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.IntegerField(**field_kwargs)
-                
-            elif field.field_type == 'date':
-                field_kwargs['widget'] = forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.DateField(**field_kwargs)
-                
-            elif field.field_type == 'textarea':
-                if field.placeholder:
-                    field_kwargs['widget'] = forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': field.placeholder})
-                else:
-                    field_kwargs['widget'] = forms.Textarea(attrs={'class': 'form-control', 'rows': 4})
-                self.fields[f'field_{field.id}'] = forms.CharField(**field_kwargs)
-                
-            elif field.field_type == 'phone':
-                if field.placeholder:
-                    field_kwargs['widget'] = forms.TextInput(attrs={'class': 'form-control', 'type': 'tel', 'placeholder': field.placeholder})
-                else:
-                    field_kwargs['widget'] = forms.TextInput(attrs={'class': 'form-control', 'type': 'tel'})
-                self.fields[f'field_{field.id}'] = forms.CharField(max_length=20, **field_kwargs)
-                
-            elif field.field_type == 'radio':
-                choices = [(choice.strip(), choice.strip()) for choice in field.get_choices_list()]
-                field_kwargs['widget'] = forms.RadioSelect(attrs={'class': 'form-check-input'})
-                self.fields[f'field_{field.id}'] = forms.ChoiceField(choices=choices, **field_kwargs)
-                
-            elif field.field_type == 'select':
-                choices = [('', '-- Select --')] + [(choice.strip(), choice.strip()) for choice in field.get_choices_list()]
-                field_kwargs['widget'] = forms.Select(attrs={'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.ChoiceField(choices=choices, **field_kwargs)
-                
-            elif field.field_type == 'checkbox':
-                choices = [(choice.strip(), choice.strip()) for choice in field.get_choices_list()]
-                field_kwargs['widget'] = forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'})
-                self.fields[f'field_{field.id}'] = forms.MultipleChoiceField(choices=choices, **field_kwargs)
-                
-            elif field.field_type == 'file':
-                field_kwargs['widget'] = forms.FileInput(attrs={'class': 'form-control'})
-                self.fields[f'field_{field.id}'] = forms.FileField(**field_kwargs)
+        # Copies of the fields compiled for the event's current form version; no queries
+        self.schema, fields = compiled_forms.get(event)
+        for name, field in fields.items():
+            self.fields[name] = copy.deepcopy(field)
+
+    def submission(self):
+        """Stored values by field id and the derived participant fields of a valid form"""
+        values = {}
+        for spec in self.schema:
+            if field_key(spec) not in self.cleaned_data:
+                continue
+            value = self.cleaned_data[field_key(spec)]
+            # Handle multiple choice fields (checkboxes)
+            if isinstance(value, list):
+                value = json.dumps(value)
+            values[spec.id] = str(value)
+        return values, participant_fields(self.schema, values)
 
     def save(self, commit=True):
         if not commit:
             return None
-            
-        # Create registration
-        registration = Registration.objects.create(event=self.event)
-        
-        # Save field data
-        for field_name, value in self.cleaned_data.items():
-            if field_name.startswith('field_'):
-                field_id = int(field_name.split('_')[1])
-                event_field = EventField.objects.get(id=field_id)
-                
-                # Handle multiple choice fields (checkboxes)
-                if isinstance(value, list):
-                    value = json.dumps(value)
-                
-                RegistrationFormFieldData.objects.create(
-                    registration=registration,
-                    event_field=event_field,
-                    field_value=str(value)
-                )
         
-        # Update cached participant fields
-        registration.update_cached_fields()
-        registration.save()
+        values, participant = self.submission()
+        # Cached participant fields come from the submission itself, so the row is written once
+        registration = Registration(event=self.event, **participant)
+        with transaction.atomic():
+            registration.save()
+            RegistrationFormFieldData.objects.bulk_create([
+                RegistrationFormFieldData(registration=registration, event_field_id=field_id, field_value=value)
+                for field_id, value in values.items()
+            ])
         
         return registration
@@ -0,0 +1,148 @@
+"""Write-behind intake for registration surges
+
+With ``REGISTRATION_INTAKE_MODE = 'spool'`` a validated registration form is
+not written to the main database inside the request. Its values are appended
+to a local SQLite spool (``REGISTRATION_SPOOL_PATH``) under the registration's
+future ``unique_id``, and the participant is sent straight to the success page,
+which polls until ``manage.py drain_registration_spool`` has written the
+registration. The spool is a file on the web host, so the drain worker must
+run on the same machine as the web processes.
+
+Spool rows are ``pending`` until a worker claims them, ``claimed`` while a
+worker holds the lease, and ``failed`` if they can never be written. Written
+rows are deleted from the spool.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS submission (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reference TEXT NOT NULL UNIQUE,
+    event_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS submission_state ON submission (state, id);
+'''
+
+def spool_enabled():
+    return getattr(settings, 'REGISTRATION_INTAKE_MODE', 'direct') == 'spool'
+
+def _spool_path():
+    return str(getattr(settings, 'REGISTRATION_SPOOL_PATH', settings.BASE_DIR / 'registration_spool.sqlite3'))
+
+class Spool:
+    """Durable FIFO of registration submissions in a SQLite file, one connection per thread"""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+
+    @property
+    def path(self):
+        return self._path or _spool_path()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'path', None) != self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; writers wait up to 10s for each other instead of failing
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # An acknowledged submission must survive a power cut, not just a crash
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.path = self.path
+        return conn
+
+    def append(self, event_id, payload):
+        """Spool a submission; returns its reference, the future registration unique_id"""
+        reference = str(uuid.uuid4())
+        self.connection().execute(
+            'INSERT INTO submission (reference, event_id, payload, created_at) VALUES (?, ?, ?, ?)',
+            (reference, event_id, json.dumps(payload), time.time()),
+        )
+        return reference
+
+    def state(self, reference):
+        """``(state, error)`` of a spooled submission, or None once it has been written (or never existed)"""
+        return self.connection().execute(
+            'SELECT state, error FROM submission WHERE reference = ?', (str(reference),)
+        ).fetchone()
+
+    def claim(self, limit, lease, max_attempts=None):
+        """Claim up to ``limit`` pending submissions, plus claimed ones whose lease of ``lease`` seconds expired
+
+        Submissions already claimed ``max_attempts`` times are failed instead,
+        so one that keeps breaking its batch can't stall the queue.
+        """
+        conn = self.connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if max_attempts:
+                conn.execute(
+                    "UPDATE submission SET state = ?, error = 'Gave up after ' || attempts || ' attempts' "
+                    'WHERE (state = ? OR (state = ? AND claimed_at < ?)) AND attempts >= ?',
+                    (FAILED, PENDING, CLAIMED, now - lease, max_attempts),
+                )
+            rows = conn.execute(
+                'SELECT id, reference, event_id, payload FROM submission '
+                'WHERE state = ? OR (state = ? AND claimed_at < ?) ORDER BY id LIMIT ?',
+                (PENDING, CLAIMED, now - lease, limit),
+            ).fetchall()
+            conn.executemany(
+                'UPDATE submission SET state = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?',
+                [(CLAIMED, now, row[0]) for row in rows],
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [(pk, reference, event_id, json.loads(payload)) for pk, reference, event_id, payload in rows]
+
+    def complete(self, ids):
+        self.connection().executemany('DELETE FROM submission WHERE id = ?', [(pk,) for pk in ids])
+
+    def release(self, ids):
+        """Return claimed submissions to the queue, e.g. after the main database was unavailable"""
+        self.connection().executemany(
+            'UPDATE submission SET state = ?, claimed_at = NULL WHERE id = ?', [(PENDING, pk) for pk in ids]
+        )
+
+    def fail(self, pk, error):
+        self.connection().execute(
+            'UPDATE submission SET state = ?, error = ? WHERE id = ?', (FAILED, str(error)[:500], pk)
+        )
+
+    def counts(self):
+        return dict(self.connection().execute('SELECT state, COUNT(*) FROM submission GROUP BY state').fetchall())
+
+spool = Spool()
+
+def enqueue(form):
+    """Spool a valid DynamicRegistrationForm; returns the provisional reference"""
+    values, participant = form.submission()
+    return spool.append(form.event.pk, {
+        # JSON object keys are strings; field ids are restored by the drain worker
+        'values': {str(field_id): value for field_id, value in values.items()},
+        'participant': participant,
+    })
@@ -0,0 +1,130 @@
+import socketserver
+import threading
+import time
+from functools import partial
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from events.models import OutgoingEmail
+from events.outbox import OutboxSender
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages: replies 250 to everything and counts what it receives"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        # Stands in for the TCP + TLS handshake and AUTH round trips of a real host
+        time.sleep(server.connect_delay)
+        self.reply('220 localhost ESMTP stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                time.sleep(server.message_delay)
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 OK queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            elif command.split(' ', 1)[0] in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay, message_delay):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.messages = 0
+
+
+class Command(BaseCommand):
+    help = 'Compare one SMTP connection per email with the outbox sender, against a local SMTP stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=200, help='Emails sent per strategy')
+        parser.add_argument('--connect-delay', type=float, default=150.0,
+                            help='Milliseconds the stand-in spends on each new connection (handshake cost)')
+        parser.add_argument('--message-delay', type=float, default=5.0,
+                            help='Milliseconds the stand-in spends accepting each message')
+
+    def handle(self, *args, **options):
+        server = StandInSMTPServer(options['connect_delay'] / 1000, options['message_delay'] / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        connection_factory = partial(
+            get_connection, 'django.core.mail.backends.smtp.EmailBackend',
+            host=host, port=port, username='', password='', use_tls=False, use_ssl=False,
+        )
+        count = options['emails']
+        self.stdout.write(
+            f'{count} emails per strategy; stand-in at {host}:{port} with {options["connect_delay"]:.0f} ms '
+            f'per connection and {options["message_delay"]:.0f} ms per message'
+        )
+        self.stdout.write(f'{"strategy":<22} {"seconds":>8} {"emails/s":>9} {"connections":>12} {"received":>9}')
+
+        try:
+            # Rows are created and marked sent inside a transaction that is rolled back
+            with transaction.atomic():
+                emails = OutgoingEmail.objects.bulk_create([
+                    OutgoingEmail(recipient=f'participant{i}@example.com', subject=f'Benchmark {i}',
+                                  body='Outbox benchmark message', next_attempt_at=timezone.now())
+                    for i in range(count)
+                ])
+                if emails[0].pk is None:
+                    emails = list(OutgoingEmail.objects.filter(subject__startswith='Benchmark ').order_by('id'))
+                sender = OutboxSender(connection_factory=connection_factory, max_per_minute=0)
+
+                server.reset()
+                started = time.perf_counter()
+                for email in emails:
+                    # What send_mail() did per registration: connect, send, quit
+                    connection_factory(fail_silently=False).send_messages([sender.message(email)])
+                self.report('connection per email', count, time.perf_counter() - started, server)
+
+                server.reset()
+                started = time.perf_counter()
+                sent, retried, failed = sender.send(emails)
+                sender.close()
+                self.report('outbox sender', count, time.perf_counter() - started, server)
+                if retried or failed:
+                    self.stdout.write(self.style.WARNING(f'Outbox sender: {retried} retried, {failed} failed'))
+                transaction.set_rollback(True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def report(self, strategy, count, elapsed, server):
+        self.stdout.write(
+            f'{strategy:<22} {elapsed:>8.2f} {count / elapsed:>9.1f} {server.connections:>12} {server.messages:>9}'
+        )
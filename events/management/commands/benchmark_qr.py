@@ -0,0 +1,48 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.qr import available_formats, build_qr, get_encoder
+
+
+class Command(BaseCommand):
+    help = 'Compare QR encoders by render time and bytes per code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Codes rendered per format')
+        parser.add_argument('--formats', default=','.join(available_formats()),
+                            help='Comma separated encoder names (default: all registered)')
+        parser.add_argument('--payload', choices=['registration', 'event'], default='registration',
+                            help='Benchmark registration UUID payloads or event registration URLs')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+
+        if options['payload'] == 'event':
+            payloads = [f'{settings.SITE_URL}/events/sample-event-{i}/register/' for i in range(iterations)]
+        else:
+            payloads = [str(uuid.uuid4()) for _ in range(iterations)]
+
+        # Layout cost is shared by every encoder, so measure it separately
+        start = time.perf_counter()
+        layouts = [build_qr(payload) for payload in payloads]
+        layout_ms = (time.perf_counter() - start) * 1000 / iterations
+
+        self.stdout.write(f'{iterations} {options["payload"]} payloads, layout {layout_ms:.3f} ms/code')
+        self.stdout.write(f'{"format":<10} {"encode ms/code":>15} {"total ms/code":>14} {"bytes/code":>11} {"codes/s":>9}')
+
+        for fmt in formats:
+            encoder = get_encoder(fmt)
+            total_bytes = 0
+            start = time.perf_counter()
+            for qr in layouts:
+                total_bytes += len(encoder.encode(qr, qr.box_size, qr.border))
+            encode_ms = (time.perf_counter() - start) * 1000 / iterations
+            total_ms = layout_ms + encode_ms
+            self.stdout.write(
+                f'{fmt:<10} {encode_ms:>15.3f} {total_ms:>14.3f} '
+                f'{total_bytes / iterations:>11.0f} {1000 / total_ms:>9.0f}'
+            )
@@ -0,0 +1,103 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, IntegrityError, transaction
+from django.urls import reverse
+
+from events.emails import queue_registration_confirmation
+from events.intake import spool
+from events.models import Event, EventField, Registration, RegistrationFormFieldData
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Write registrations accepted in surge intake mode (REGISTRATION_INTAKE_MODE=spool) to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Submissions written per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the spool for new submissions')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep between polls when idle')
+        parser.add_argument('--lease', type=float, default=60.0,
+                            help='Seconds before submissions claimed by a worker that died are claimed again')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Claims after which a submission whose batch keeps failing is marked failed')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                written, failed = self.process_batch(options['batch_size'], options['lease'], options['max_attempts'])
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Claimed submissions went back to the spool; try again after a pause
+                logger.exception('Could not drain the registration spool')
+                time.sleep(options['interval'])
+                continue
+            if written or failed:
+                self.stdout.write(f'Wrote {written} registration(s), {failed} failed')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        counts = spool.counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Registration spool drained ({counts.get("failed", 0)} failed submission(s) kept in {spool.path})'
+        ))
+
+    def process_batch(self, batch_size, lease, max_attempts=None):
+        claimed = spool.claim(batch_size, lease, max_attempts)
+        if not claimed:
+            return 0, 0
+
+        events = Event.objects.select_related('organizer').in_bulk({event_id for _, _, event_id, _ in claimed})
+        # Fields deleted since the submission are dropped rather than failing the batch
+        field_ids = set(EventField.objects.filter(event__in=list(events)).values_list('id', flat=True))
+        done, failed, field_data = [], [], []
+        written = 0
+
+        try:
+            with transaction.atomic():
+                for pk, reference, event_id, payload in claimed:
+                    event = events.get(event_id)
+                    if event is None:
+                        failed.append((pk, 'Event no longer exists'))
+                        continue
+                    registration = Registration(event=event, unique_id=reference, **payload['participant'])
+                    try:
+                        with transaction.atomic():
+                            registration.save()
+                    except IntegrityError as e:
+                        if Registration.objects.filter(unique_id=reference).exists():
+                            # Written by an earlier run that stopped before clearing the spool
+                            done.append(pk)
+                        else:
+                            failed.append((pk, e))
+                        continue
+                    except DatabaseError as e:
+                        # e.g. a DataError for a value too long for its column: only this submission fails
+                        failed.append((pk, e))
+                        continue
+                    field_data.extend(
+                        RegistrationFormFieldData(registration=registration, event_field_id=int(field_id),
+                                                  field_value=value)
+                        for field_id, value in payload['values'].items() if int(field_id) in field_ids
+                    )
+                    if registration.participant_email:
+                        # Committed with the registration, so a rerun after a crash neither skips nor repeats it
+                        qr_code_url = f"{settings.SITE_URL}{reverse('events:qr_code', kwargs={'unique_id': reference})}"
+                        queue_registration_confirmation(registration, qr_code_url)
+                    done.append(pk)
+                    written += 1
+                RegistrationFormFieldData.objects.bulk_create(field_data)
+        except Exception:
+            spool.release([pk for pk, _, _, _ in claimed])
+            raise
+
+        spool.complete(done)
+        for pk, error in failed:
+            spool.fail(pk, error)
+        return written, len(failed)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from events.models import Registration
+
+
+class Command(BaseCommand):
+    help = 'Render QR images for registrations still in the "QR pending" state (deferred QR generation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Registrations rendered per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new pending registrations')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls when idle')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        while True:
+            processed = self.process_batch(batch_size)
+            if processed:
+                self.stdout.write(f'Rendered {processed} QR code(s)')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('QR queue drained'))
+
+    def process_batch(self, batch_size):
+        pending = Q(qr_code_image='') | Q(qr_code_image__isnull=True)
+        registrations = list(
+            Registration.objects.filter(pending).only('id', 'event', 'unique_id', 'qr_code_image').order_by('id')[:batch_size]
+        )
+
+        processed = 0
+        for registration in registrations:
+            # ensure_qr_code() only claims rows that are still pending, so an
+            # on-demand render from a view never gets overwritten here
+            if registration.ensure_qr_code():
+                processed += 1
+        return processed
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from events.models import Event, Registration
+
+
+def counted(**filters):
+    """Correlated COUNT of an event's registrations"""
+    counts = (
+        Registration.objects.filter(event=OuterRef('pk'), **filters)
+        .order_by().values('event').annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recount Event.registration_count and Event.attended_count and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events',
+                            help='Only check this event id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        events = Event.objects.order_by('pk')
+        if options['events']:
+            events = events.filter(pk__in=options['events'])
+
+        drifted = list(
+            events.annotate(actual_registrations=counted(), actual_attended=counted(status='attended'))
+            .filter(~Q(registration_count=F('actual_registrations')) | ~Q(attended_count=F('actual_attended')))
+            .values_list('pk', 'name', 'registration_count', 'actual_registrations',
+                         'attended_count', 'actual_attended')
+        )
+        for pk, name, registrations, actual_registrations, attended, actual_attended in drifted:
+            self.stdout.write(
+                f'Event {pk} ({name}): registrations {registrations} -> {actual_registrations}, '
+                f'attended {attended} -> {actual_attended}'
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All event counters match their registrations'))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} event(s) drifted; run without --dry-run to repair'))
+            return
+
+        # Recount inside the UPDATE itself so check-ins landing meanwhile are not overwritten
+        repaired = Event.objects.filter(pk__in=[row[0] for row in drifted]).update(
+            registration_count=counted(), attended_count=counted(status='attended')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters of {repaired} event(s)'))
@@ -0,0 +1,112 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from events.models import Registration
+from events.qr_storage import is_content_addressed, qr_root, store_qr_image
+
+
+class Command(BaseCommand):
+    help = 'Move registration QR images from the flat qr_codes/ directory into the content-addressed sharded layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows relocated and bulk-updated per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without changing anything')
+        parser.add_argument('--prune', action='store_true',
+                            help='Afterwards delete files under the QR directory that no registration references')
+        parser.add_argument('--prune-grace', type=float, default=60.0,
+                            help='Minutes a file must be old before --prune deletes it; newer files may belong '
+                                 'to registrations that are still being written')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        moved = missing = skipped = 0
+        last_id = 0
+        started = time.perf_counter()
+
+        queryset = Registration.objects.exclude(qr_code_image='').exclude(qr_code_image__isnull=True).order_by('id')
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).only('id', 'qr_code_image')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            changed = []
+            old_names = []
+            for registration in batch:
+                field = registration.qr_code_image
+                if is_content_addressed(field.name):
+                    skipped += 1
+                    continue
+                try:
+                    with field.storage.open(field.name, 'rb') as f:
+                        data = f.read()
+                except (FileNotFoundError, OSError):
+                    missing += 1
+                    self.stderr.write(f'Missing file for registration {registration.id}: {field.name}')
+                    continue
+                if not dry_run:
+                    old_names.append(field.name)
+                    field.name = store_qr_image(data, storage=field.storage)
+                changed.append(registration)
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    Registration.objects.bulk_update(changed, ['qr_code_image'])
+                # Old files go only once the new paths are committed
+                for name in old_names:
+                    self.storage.delete(name)
+            moved += len(changed)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would relocate' if dry_run else 'Relocated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} QR image(s) in {elapsed:.1f}s; {skipped} already sharded, {missing} missing'
+        ))
+
+        if options['prune']:
+            self.prune(dry_run, timedelta(minutes=options['prune_grace']))
+
+    @property
+    def storage(self):
+        return Registration._meta.get_field('qr_code_image').storage
+
+    def prune(self, dry_run, grace):
+        # A registration stores its image before its row commits, so files newer
+        # than the grace period may be referenced by a row this query can't see yet
+        cutoff = timezone.now() - grace
+        referenced = set(
+            Registration.objects.exclude(qr_code_image='').values_list('qr_code_image', flat=True)
+        )
+        removed = recent = 0
+        for name in self.walk(qr_root()):
+            if name in referenced:
+                continue
+            try:
+                modified = self.storage.get_modified_time(name)
+            except (NotImplementedError, FileNotFoundError, OSError):
+                modified = None
+            if modified is None or modified > cutoff:
+                recent += 1
+                continue
+            if not dry_run:
+                self.storage.delete(name)
+            removed += 1
+        verb = 'Would prune' if dry_run else 'Pruned'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} unreferenced QR file(s); kept {recent} newer than the grace period'
+        ))
+
+    def walk(self, path):
+        try:
+            directories, files = self.storage.listdir(path)
+        except FileNotFoundError:
+            return
+        for name in files:
+            yield f'{path}/{name}'
+        for directory in directories:
+            yield from self.walk(f'{path}/{directory}')
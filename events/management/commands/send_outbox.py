@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.outbox import OutboxSender, claim
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox over one reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails claimed per batch (lowered to what the rate limit sends within the claim lease)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox for due emails')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep between polls when idle')
+        parser.add_argument('--max-per-minute', type=int,
+                            help='Sending rate limit (default EMAIL_OUTBOX_MAX_PER_MINUTE; 0 = unlimited)')
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(max_per_minute=options['max_per_minute'])
+        totals = [0, 0, 0]
+        try:
+            while True:
+                emails = claim(sender.batch_limit(options['batch_size']))
+                if emails:
+                    counts = sender.send(emails)
+                    totals = [total + count for total, count in zip(totals, counts)]
+                    self.stdout.write('Sent {}, retrying {}, failed {}'.format(*counts))
+                    continue
+                if not options['loop']:
+                    break
+                # Don't hold the SMTP session open while idle; the host would drop it anyway
+                sender.close()
+                time.sleep(options['interval'])
+        finally:
+            sender.close()
+
+        self.stdout.write(self.style.SUCCESS('Outbox drained: sent {}, retrying {}, failed {}'.format(*totals)))
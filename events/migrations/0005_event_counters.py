@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Registration = apps.get_model('events', 'Registration')
+
+    def count(**filters):
+        counts = (
+            Registration.objects.filter(event=OuterRef('pk'), **filters)
+            .order_by().values('event').annotate(n=Count('pk')).values('n')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    Event.objects.update(registration_count=count(), attended_count=count(status='attended'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_registration_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='attended_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='registration_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_event_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='form_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['event', 'status'], name='events_regi_event_i_c98244_idx'),
+        ),
+    ]
@@ -1,13 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
 import uuid
-import qrcode
-from io import BytesIO
-from django.core.files import File
 import json
 
+def qr_generation_deferred():
+    """Whether registration QR images are rendered by the background worker"""
+    from django.conf import settings
+    return getattr(settings, 'QR_GENERATION_MODE', 'sync') == 'deferred'
+
 class Event(models.Model):
     id = models.AutoField(primary_key=True)
     organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='organized_events')
@@ -25,6 +27,14 @@ class Event(models.Model):
     registration_close_date = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized from registrations and only ever changed with F() updates
+    # (see events.signals and checkin.attendance); reconcile_event_counters repairs drift
+    registration_count = models.PositiveIntegerField(default=0, editable=False)
+    attended_count = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped on every EventField write; keys the compiled registration form schema
+    form_version = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('registration_count', 'attended_count', 'form_version')
 
     class Meta:
         ordering = ['-created_at']
@@ -41,8 +51,25 @@ class Event(models.Model):
             while Event.objects.filter(slug=self.slug).exists():
                 self.slug = f"{original_slug}-{counter}"
                 counter += 1
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Don't write back counters loaded before concurrent check-ins moved them
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
+        # Drop the memoized registration QR for both the current and the previously loaded slug
+        from .qr_cache import invalidate_event_qr
+        invalidate_event_qr(self.slug, getattr(self, '_loaded_slug', None))
+        self._loaded_slug = self.slug
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_slug = instance.__dict__.get('slug')
+        return instance
+
     def get_absolute_url(self):
         return reverse('events:event_detail', kwargs={'pk': self.pk})
 
@@ -51,44 +78,24 @@ class Event(models.Model):
 
     @property
     def total_registrations(self):
-        return self.registrations.count()
+        return self.registration_count
 
     @property
     def total_attended(self):
-        return self.registrations.filter(status='attended').count()
+        return self.attended_count
     
+    def get_registration_full_url(self):
+        """Absolute registration URL encoded in the event QR code"""
+        from django.conf import settings
+        return f"{settings.SITE_URL}{self.get_registration_url()}"
+
     @property
     def registration_qr_code(self):
-        """Generate base64 encoded QR code for registration URL"""
-        from django.conf import settings
+        """Base64 encoded QR code for registration URL, memoized in the shared cache"""
         import base64
-        
-        # Build full registration URL
-        registration_url = f"{settings.SITE_URL}{self.get_registration_url()}"
-        
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(registration_url)
-        qr.make(fit=True)
-
-        # Create QR code image
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to RGB if necessary
-        if qr_img.mode != 'RGB':
-            qr_img = qr_img.convert('RGB')
-
-        # Convert to base64
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        from .qr_cache import get_event_qr_png
+
+        return base64.b64encode(get_event_qr_png(self)).decode('utf-8')
 
 class EventField(models.Model):
     FIELD_TYPE_CHOICES = [
@@ -152,6 +159,8 @@ class Registration(models.Model):
     qr_code_image = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     attended_at = models.DateTimeField(null=True, blank=True)
+    # Version cursor for roster snapshots; queryset .update() calls must set it explicitly
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     # Cache commonly accessed fields for performance
     participant_name = models.CharField(max_length=200, blank=True)
@@ -160,70 +169,86 @@ class Registration(models.Model):
 
     class Meta:
         ordering = ['-registered_at']
+        indexes = [models.Index(fields=['event', 'status'])]
 
     def __str__(self):
         return f"{self.event.name} - {self.participant_name or 'Registration'} ({self.unique_id})"
 
     def save(self, *args, **kwargs):
-        # Generate QR code if not exists
-        if not self.qr_code_image:
+        from .qr_payload import signed_payloads_enabled
+
+        # Generate QR code if not exists; in deferred mode the QR worker renders it later
+        needs_qr = not self.qr_code_image and not qr_generation_deferred()
+        if needs_qr and (self.pk is not None or not signed_payloads_enabled()):
             self.generate_qr_code()
-        super().save(*args, **kwargs)
+            needs_qr = False
+        # The event counters are updated from post_save, in the same transaction as the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_status = self.status
+        if needs_qr:
+            # Signed payloads embed the primary key, which only exists after the insert
+            self.generate_qr_code()
+            Registration.objects.filter(pk=self.pk).update(qr_code_image=self.qr_code_image.name)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the stored status so save signals can tell what changed
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.status
 
     @property
-    def qr_code(self):
-        """Generate base64 encoded QR code for this registration"""
-        import base64
-        
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(str(self.unique_id))
-        qr.make(fit=True)
-
-        # Create QR code image
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to RGB if necessary
-        if qr_img.mode != 'RGB':
-            qr_img = qr_img.convert('RGB')
-
-        # Convert to base64
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    def qr_pending(self):
+        """True while the QR image is still waiting for the background worker"""
+        return not self.qr_code_image
+
+    def ensure_qr_code(self):
+        """Render and store the QR image on demand if the worker hasn't caught up yet"""
+        if not self.qr_pending:
+            return False
+        self.generate_qr_code()
+        # Only claim the row if the worker didn't store an image in the meantime
+        Registration.objects.filter(pk=self.pk).filter(
+            models.Q(qr_code_image='') | models.Q(qr_code_image__isnull=True)
+        ).update(qr_code_image=self.qr_code_image.name)
+        return True
+
+    @property
+    def qr_code_url(self):
+        """URL of the cached QR image for this registration, versioned by the stored image's digest"""
+        from .qr_storage import content_digest
+
+        url = reverse('events:qr_image', kwargs={'unique_id': self.unique_id})
+        digest = content_digest(self.qr_code_image.name)
+        return f'{url}?v={digest}' if digest else url
+
+    @property
+    def qr_payload(self):
+        """Text encoded in this registration's QR code (bare UUID or signed token)"""
+        from .qr_payload import make_payload
+        return make_payload(self)
+
+    def render_qr_png(self):
+        """Render the QR code PNG for this registration"""
+        from .qr import render_qr
+        return render_qr(self.qr_payload)
 
     def generate_qr_code(self):
         """Generate QR code for this registration"""
-        qr_data = str(self.unique_id)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        # Create QR code image
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to RGB if necessary
-        if qr_img.mode != 'RGB':
-            qr_img = qr_img.convert('RGB')        # Save to BytesIO
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        buffer.seek(0)
+        from .qr_cache import image_digest, qr_image_cache, registration_qr_key
+        from .qr_storage import store_qr_image
+
+        data = self.render_qr_png()
         
-        # Save to model
-        filename = f'qr_code_{self.unique_id}.png'
-        self.qr_code_image.save(filename, File(buffer), save=False)
+        # Save to model under a content-addressed, sharded path
+        self.qr_code_image.name = store_qr_image(data, storage=self.qr_code_image.storage)
+        qr_image_cache.set(registration_qr_key(self.unique_id, image_digest(data)), data)
 
     def get_field_data(self):
         """Get all form field data as dictionary"""
@@ -284,4 +309,36 @@ class RegistrationFormFieldData(models.Model):
                 return ', '.join(values) if isinstance(values, list) else self.field_value
             except (json.JSONDecodeError, TypeError):
                 return self.field_value
-        return self.field_value
\ No newline at end of file
+        return self.field_value
+
+class OutgoingEmail(models.Model):
+    """Email waiting in the outbox for `manage.py send_outbox` (see events.outbox)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    registration = models.ForeignKey(Registration, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='emails')
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, help_text='Empty uses DEFAULT_FROM_EMAIL')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Due time while pending; pushed forward by claims (lease) and retries (backoff)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} - {self.subject} ({self.get_status_display()})"
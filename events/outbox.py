@@ -0,0 +1,188 @@
+"""Email outbox: queued confirmation emails sent over one reused SMTP connection
+
+``queue_email()`` only inserts an OutgoingEmail row, so registration requests
+no longer wait for the mail server. ``manage.py send_outbox`` claims due rows
+in batches and sends them through a single connection from
+``get_connection()``, spaced to ``EMAIL_OUTBOX_MAX_PER_MINUTE``. Temporary
+failures (4xx replies, dropped connections) are retried with exponential
+backoff up to ``EMAIL_OUTBOX_MAX_ATTEMPTS``; permanent 5xx refusals fail the
+row at once. With ``EMAIL_DELIVERY_MODE = 'sync'`` each queued email is also
+sent straight after the surrounding transaction commits, and falls back to the
+outbox if that attempt fails.
+"""
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Seconds before the first retry; doubled per attempt up to MAX_BACKOFF
+BASE_BACKOFF = 30
+MAX_BACKOFF = 60 * 60
+# Claimed rows are skipped by other workers for this long
+CLAIM_LEASE = timedelta(minutes=5)
+
+def _max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+
+def _max_per_minute():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_PER_MINUTE', 0)
+
+def sync_delivery():
+    return getattr(settings, 'EMAIL_DELIVERY_MODE', 'sync') == 'sync'
+
+def backoff(attempts):
+    """Delay before retrying an email that has failed ``attempts`` times"""
+    return timedelta(seconds=min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF))
+
+def queue_email(recipient, subject, body, registration=None):
+    now = timezone.now()
+    email = OutgoingEmail.objects.create(
+        recipient=recipient, subject=subject, body=body, registration=registration,
+        # Sent right away in sync mode, so keep workers off it unless that attempt never finishes
+        next_attempt_at=now + CLAIM_LEASE if sync_delivery() else now,
+    )
+    if sync_delivery():
+        transaction.on_commit(lambda: send_now(email))
+    return email
+
+def send_now(email):
+    sender = OutboxSender()
+    try:
+        sender.send([email])
+    finally:
+        sender.close()
+
+def claim(limit):
+    """Due pending emails, pushed past the claim lease so concurrent workers skip them"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit]
+        )
+        OutgoingEmail.objects.filter(pk__in=ids).update(next_attempt_at=now + CLAIM_LEASE)
+    return list(OutgoingEmail.objects.filter(pk__in=ids).order_by('id'))
+
+def is_permanent(error):
+    """5xx SMTP replies will not succeed on retry; everything else might"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+class RateLimiter:
+    """Spaces calls evenly so no more than ``per_minute`` happen in any minute (0 = unlimited)"""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = self.clock()
+        if self._next is not None and now < self._next:
+            self.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+class OutboxSender:
+    """Sends outbox rows through one SMTP connection that stays open between batches"""
+
+    def __init__(self, connection_factory=get_connection, max_per_minute=None):
+        self.connection_factory = connection_factory
+        self.max_per_minute = _max_per_minute() if max_per_minute is None else max_per_minute
+        self.limiter = RateLimiter(self.max_per_minute)
+        self.connection = None
+
+    def batch_limit(self, batch_size):
+        """Largest batch to claim: at the rate limit it is sent within half of CLAIM_LEASE
+
+        The sender waits between messages while the rest of the batch stays
+        claimed, so a larger batch would outlive its lease and be claimed and
+        sent again by another worker.
+        """
+        if not self.max_per_minute:
+            return batch_size
+        lease_minutes = CLAIM_LEASE.total_seconds() / 60
+        return max(1, min(batch_size, int(self.max_per_minute * lease_minutes / 2)))
+
+    def open(self):
+        if self.connection is None:
+            connection = self.connection_factory(fail_silently=False)
+            connection.open()
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def message(self, email):
+        return EmailMessage(email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL,
+                            [email.recipient])
+
+    def send(self, emails):
+        """Send claimed emails; returns ``(sent, retried, failed)`` counts"""
+        sent, retry, failed = [], [], []
+        for index, email in enumerate(emails):
+            try:
+                connection = self.open()
+            except Exception as e:
+                # Server unreachable: this and the remaining emails wait for their backoff
+                logger.warning('Could not connect to the mail server: %s', e)
+                for waiting in emails[index:]:
+                    waiting.last_error = f'{type(e).__name__}: {e}'[:1000]
+                    (failed if waiting.attempts + 1 >= _max_attempts() else retry).append(waiting)
+                break
+            self.limiter.wait()
+            try:
+                connection.send_messages([self.message(email)])
+            except Exception as e:
+                if not is_permanent(e):
+                    # The connection may be unusable; reconnect for the next message
+                    self.close()
+                email.last_error = f'{type(e).__name__}: {e}'[:1000]
+                if is_permanent(e) or email.attempts + 1 >= _max_attempts():
+                    failed.append(email)
+                else:
+                    retry.append(email)
+                logger.warning('Could not send outbox email %s to %s: %s', email.pk, email.recipient, e)
+            else:
+                sent.append(email)
+        self.record(sent, retry, failed)
+        return len(sent), len(retry), len(failed)
+
+    def record(self, sent, retry, failed):
+        now = timezone.now()
+        if sent:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in sent]).update(
+                status=SENT, sent_at=now, attempts=F('attempts') + 1, last_error='',
+            )
+        for email in retry:
+            email.attempts += 1
+            email.next_attempt_at = now + backoff(email.attempts)
+        for email in failed:
+            email.attempts += 1
+            email.status = FAILED
+        OutgoingEmail.objects.bulk_update(retry + failed, ['status', 'attempts', 'next_attempt_at', 'last_error'])
@@ -0,0 +1,158 @@
+"""QR rendering service shared by events, registrations and views"""
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from qrcode import constants
+
+ERROR_CORRECTION = {
+    'L': constants.ERROR_CORRECT_L,
+    'M': constants.ERROR_CORRECT_M,
+    'Q': constants.ERROR_CORRECT_Q,
+    'H': constants.ERROR_CORRECT_H,
+}
+
+DEFAULT_OPTIONS = {
+    'error_correction': 'L',
+    'box_size': 10,
+    'border': 4,
+}
+
+class QREncoder:
+    """Turns a laid-out ``qrcode.QRCode`` into bytes of one output format"""
+    name = None
+    content_type = None
+    extension = None
+
+    def encode(self, qr, box_size, border):
+        raise NotImplementedError
+
+class PNGEncoder(QREncoder):
+    """1-bit PNG, which scanners and browsers read the same as the old RGB output"""
+    name = 'png'
+    content_type = 'image/png'
+    extension = 'png'
+
+    def encode(self, qr, box_size, border):
+        img = qr.make_image(fill_color='black', back_color='white')
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+class RGBPNGEncoder(PNGEncoder):
+    """RGB PNG as produced before the QR service existed; kept for comparison"""
+    name = 'png-rgb'
+
+    def encode(self, qr, box_size, border):
+        img = qr.make_image(fill_color='black', back_color='white')
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+class SVGEncoder(QREncoder):
+    """Scalable SVG with one path segment per horizontal run of dark modules"""
+    name = 'svg'
+    content_type = 'image/svg+xml'
+    extension = 'svg'
+
+    def encode(self, qr, box_size, border):
+        matrix = qr.get_matrix()
+        size = len(matrix)
+        segments = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < size:
+                if row[x]:
+                    start = x
+                    while x < size and row[x]:
+                        x += 1
+                    segments.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+                else:
+                    x += 1
+        pixels = size * box_size
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+            f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{"".join(segments)}" fill="#000"/></svg>'
+        ).encode('ascii')
+
+class MatrixEncoder(QREncoder):
+    """Compact module matrix: 2-byte big-endian side length, then row-major bits (MSB first)"""
+    name = 'matrix'
+    content_type = 'application/octet-stream'
+    extension = 'qrm'
+
+    def encode(self, qr, box_size, border):
+        matrix = qr.get_matrix()
+        size = len(matrix)
+        out = bytearray(size.to_bytes(2, 'big'))
+        byte = 0
+        bits = 0
+        for row in matrix:
+            for module in row:
+                byte = (byte << 1) | bool(module)
+                bits += 1
+                if bits == 8:
+                    out.append(byte)
+                    byte = bits = 0
+        if bits:
+            out.append(byte << (8 - bits))
+        return bytes(out)
+
+def decode_matrix(data):
+    """Inverse of ``MatrixEncoder.encode``; returns a list of rows of booleans"""
+    size = int.from_bytes(data[:2], 'big')
+    payload = data[2:]
+    rows = []
+    for y in range(size):
+        row = []
+        for x in range(size):
+            index = y * size + x
+            row.append(bool(payload[index // 8] & (0x80 >> (index % 8))))
+        rows.append(row)
+    return rows
+
+_encoders = {}
+
+def register_encoder(encoder):
+    """Make an encoder available to ``render_qr`` under ``encoder.name``"""
+    _encoders[encoder.name] = encoder
+    return encoder
+
+def get_encoder(fmt):
+    try:
+        return _encoders[fmt]
+    except KeyError:
+        raise ValueError(f'Unknown QR format: {fmt!r} (available: {", ".join(sorted(_encoders))})')
+
+def available_formats():
+    return sorted(_encoders)
+
+for _encoder in (PNGEncoder(), RGBPNGEncoder(), SVGEncoder(), MatrixEncoder()):
+    register_encoder(_encoder)
+
+def get_default_options():
+    """Service defaults, overridable through the QR_OPTIONS setting"""
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'QR_OPTIONS', {})}
+
+def build_qr(data, error_correction=None, box_size=None, border=None):
+    """Lay out a QR code for ``data`` using the service defaults for unset options"""
+    defaults = get_default_options()
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECTION[error_correction or defaults['error_correction']],
+        box_size=box_size or defaults['box_size'],
+        border=defaults['border'] if border is None else border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+def render_qr(data, fmt='png', **options):
+    """Render ``data`` as a QR code in the given format and return the encoded bytes"""
+    encoder = get_encoder(fmt)
+    qr = build_qr(data, **options)
+    return encoder.encode(qr, qr.box_size, qr.border)
@@ -0,0 +1,127 @@
+"""Caches of rendered QR images: an in-process LRU for registrations and the shared cache for events"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .qr import get_default_options, render_qr
+
+
+class QRImageCache:
+    """LRU cache of PNG payloads keyed by registration unique_id and content digest, capped by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        # Payloads larger than the whole cache are never worth keeping
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+qr_image_cache = QRImageCache(getattr(settings, 'QR_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+
+def _load_png(registration):
+    """Read the persisted QR image, rendering it only when no file is available"""
+    if registration.qr_code_image:
+        try:
+            with registration.qr_code_image.open('rb') as f:
+                return f.read()
+        except (FileNotFoundError, OSError):
+            pass
+    return registration.render_qr_png()
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def registration_qr_key(unique_id, digest):
+    # A key never maps to other bytes, so a re-rendered image can't be served stale
+    return f'{unique_id}:{digest}'
+
+
+def get_registration_qr_png(unique_id, version=None):
+    """Return ``(png, digest)`` for a registration QR code
+
+    ``version`` is the content digest from a versioned image URL; when that
+    image is cached it is returned without a query. Otherwise the registration
+    is loaded and its current image returned, whatever its digest.
+    """
+    from .models import Registration
+
+    if version:
+        data = qr_image_cache.get(registration_qr_key(unique_id, version))
+        if data is not None:
+            return data, version
+
+    registration = Registration.objects.only('id', 'event', 'unique_id', 'qr_code_image').get(unique_id=unique_id)
+    data = _load_png(registration)
+    digest = image_digest(data)
+    qr_image_cache.set(registration_qr_key(unique_id, digest), data)
+    return data, digest
+
+
+def event_qr_cache_key(slug):
+    """Shared-cache key for an event registration QR, derived from everything that changes its content"""
+    options = sorted(get_default_options().items())
+    digest = hashlib.sha1(f'{slug}|{settings.SITE_URL}|{options}'.encode('utf-8')).hexdigest()
+    return f'events:registration-qr:{digest}'
+
+
+def get_event_qr_png(event):
+    """Return PNG bytes of the event registration QR, rendering only on a shared-cache miss"""
+    key = event_qr_cache_key(event.slug)
+    data = cache.get(key)
+    if data is None:
+        data = render_qr(event.get_registration_full_url())
+        cache.set(key, data, timeout=None)
+    return data
+
+
+def invalidate_event_qr(*slugs):
+    cache.delete_many([event_qr_cache_key(slug) for slug in slugs if slug])
+
+
+def event_qr_etag(slug):
+    return '"%s"' % event_qr_cache_key(slug).rsplit(':', 1)[1]
@@ -0,0 +1,49 @@
+"""Content-addressed, sharded storage layout for registration QR images
+
+Files live at ``qr_codes/<h[0:2]>/<h[2:4]>/<h>.png`` where ``h`` is the SHA-256
+of the PNG bytes, so no directory grows past a few hundred entries and
+identical renders are stored once.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+def qr_root():
+    return getattr(settings, 'QR_CODE_DIR', 'qr_codes').strip('/')
+
+def content_path(data, extension='png'):
+    """Storage path for QR bytes, derived from their SHA-256 digest"""
+    digest = hashlib.sha256(data).hexdigest()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return '/'.join([qr_root(), *shards, f'{digest}.{extension}'])
+
+def is_content_addressed(name):
+    pattern = r'^%s/%s[0-9a-f]{64}\.\w+$' % (
+        re.escape(qr_root()), ''.join(r'[0-9a-f]{%d}/' % SHARD_WIDTH for _ in range(SHARD_DEPTH))
+    )
+    return bool(name) and re.match(pattern, name) is not None
+
+def content_digest(name):
+    """SHA-256 of a stored QR image read from its content-addressed name, or None for other names"""
+    if not is_content_addressed(name):
+        return None
+    return name.rsplit('/', 1)[1].split('.', 1)[0]
+
+def store_qr_image(data, extension='png', storage=None):
+    """Store QR bytes under their content address and return the storage name, reusing identical files"""
+    storage = storage or default_storage
+    path = content_path(data, extension)
+    if storage.exists(path):
+        return path
+    name = storage.save(path, ContentFile(data))
+    if name != path:
+        # Another process stored the same bytes between exists() and save(), and
+        # the storage picked a free name; keep the content-addressed copy only
+        storage.delete(name)
+    return path
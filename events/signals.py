@@ -0,0 +1,57 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import stats
+from .models import Event, EventField, Registration
+
+
+def adjust_counters(event_id, registered=0, attended=0):
+    """Move an event's counters with one ``UPDATE ... SET count = count + n``"""
+    changes = {}
+    if registered:
+        changes['registration_count'] = F('registration_count') + registered
+    if attended:
+        changes['attended_count'] = F('attended_count') + attended
+    if changes:
+        Event.objects.filter(pk=event_id).update(**changes)
+        transaction.on_commit(partial(stats.invalidate_event, event_id))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def drop_organizer_stats(sender, instance, **kwargs):
+    transaction.on_commit(partial(stats.forget_event, instance))
+
+
+@receiver(post_save, sender=Registration)
+def count_saved_registration(sender, instance, created, update_fields=None, **kwargs):
+    attended = instance.status == 'attended'
+    if created:
+        adjust_counters(instance.event_id, registered=1, attended=int(attended))
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    loaded_status = getattr(instance, '_loaded_status', None)
+    if loaded_status is not None and (loaded_status == 'attended') != attended:
+        adjust_counters(instance.event_id, attended=1 if attended else -1)
+
+
+@receiver(post_delete, sender=Registration)
+def count_deleted_registration(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Event):
+        # The whole event is being deleted along with its counters
+        return
+    adjust_counters(instance.event_id, registered=-1, attended=-int(instance.status == 'attended'))
+
+
+@receiver(post_save, sender=EventField)
+@receiver(post_delete, sender=EventField)
+def bump_form_version(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Event):
+        return
+    # Moves registration forms to a freshly compiled schema (see events.form_schema)
+    Event.objects.filter(pk=instance.event_id).update(form_version=F('form_version') + 1)
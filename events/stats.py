@@ -0,0 +1,59 @@
+"""Per-organizer dashboard totals, cached in the shared cache
+
+The totals are one aggregate over the organizer's events, summing the
+denormalized counter columns. Registration, check-in and event writes call
+``invalidate_event()``/``invalidate()`` so the cached totals are dropped as
+soon as they change; the timeout only bounds how long a missed invalidation
+can linger.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Event
+
+# Organizers are fixed once an event exists, so the lookup can live much longer
+EVENT_ORGANIZER_TIMEOUT = 24 * 60 * 60
+
+def _timeout():
+    return getattr(settings, 'ORGANIZER_STATS_TIMEOUT', 15 * 60)
+
+def _stats_key(organizer_id):
+    return f'events:organizer-stats:{organizer_id}'
+
+def _organizer_key(event_id):
+    return f'events:event-organizer:{event_id}'
+
+def organizer_stats(user):
+    """``total_events``, ``published_events``, ``total_participants`` and ``total_attended`` of an organizer"""
+    key = _stats_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = Event.objects.filter(organizer=user).aggregate(
+            total_events=Count('id'),
+            published_events=Count('id', filter=Q(is_published=True)),
+            total_participants=Coalesce(Sum('registration_count'), 0),
+            total_attended=Coalesce(Sum('attended_count'), 0),
+        )
+        cache.set(key, stats, timeout=_timeout())
+    return stats
+
+def invalidate(organizer_id):
+    cache.delete(_stats_key(organizer_id))
+
+def invalidate_event(event_id):
+    """Drop the cached totals of the event's organizer"""
+    key = _organizer_key(event_id)
+    organizer_id = cache.get(key)
+    if organizer_id is None:
+        organizer_id = Event.objects.filter(pk=event_id).values_list('organizer_id', flat=True).first()
+        if organizer_id is None:
+            return
+        cache.set(key, organizer_id, timeout=EVENT_ORGANIZER_TIMEOUT)
+    invalidate(organizer_id)
+
+def forget_event(event):
+    """Called when an event is saved or deleted"""
+    cache.delete(_organizer_key(event.pk))
+    invalidate(event.organizer_id)
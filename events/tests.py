@@ -1,3 +1,378 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import smtplib
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DataError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .intake import spool
+from .models import Event, EventField, OutgoingEmail, Registration, RegistrationFormFieldData
+from .outbox import OutboxSender, claim, queue_email
+from .qr_cache import qr_image_cache
+
+
+@override_settings(QR_GENERATION_MODE='deferred')
+class EventListQueryCountTests(TestCase):
+    """Event lists read the counter columns instead of counting registrations per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('organizer', 'organizer@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_event(self, number):
+        today = datetime.date.today()
+        event = Event.objects.create(
+            organizer=self.user, name=f'Event {number}', start_date=today, end_date=today,
+            start_time=datetime.time(9), end_time=datetime.time(17), location='Hall', is_published=True,
+        )
+        Registration.objects.create(event=event, participant_name='Pending')
+        Registration.objects.create(event=event, participant_name='Attended', status='attended')
+        return event
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_events(self):
+        urls = [
+            reverse('events:event_list'),
+            reverse('checkin:checkin_home'),
+            reverse('core:user_profile'),
+            reverse('admin:events_event_changelist'),
+        ]
+        self.add_event(0)
+        for url in urls:
+            # The first profile visit creates the UserProfile row
+            self.client.get(url)
+        baseline = {url: self.count_queries(url) for url in urls}
+        for number in range(1, 5):
+            self.add_event(number)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), baseline[url])
+
+    def test_counters_are_rendered(self):
+        self.add_event(0)
+        response = self.client.get(reverse('events:event_list'))
+        self.assertContains(response, '2 registrations')
+        self.assertContains(response, '1 attended')
+
+
+@override_settings(QR_GENERATION_MODE='deferred')
+class RegistrationQRImageTests(TestCase):
+    """Only versioned image URLs are cached as immutable, and only while the version matches"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        today = datetime.date.today()
+        self.event = Event.objects.create(
+            organizer=User.objects.create_user('organizer', password='password'), name='Conference',
+            start_date=today, end_date=today, start_time=datetime.time(9), end_time=datetime.time(17),
+            location='Hall', is_published=True,
+        )
+
+    def test_versioned_url_is_immutable_until_the_image_changes(self):
+        registration = Registration.objects.create(event=self.event, participant_name='Ada')
+        registration.ensure_qr_code()
+        old_url = registration.qr_code_url
+        self.assertIn('?v=', old_url)
+
+        response = self.client.get(old_url)
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(old_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with override_settings(QR_PAYLOAD_FORMAT='signed'):
+            registration.generate_qr_code()
+            registration.save(update_fields=['qr_code_image'])
+        self.assertNotEqual(registration.qr_code_url, old_url)
+
+        # The old version is still cached here, but other processes only have the new image
+        qr_image_cache.clear()
+        stale = self.client.get(old_url)
+        self.assertEqual(stale.content, registration.qr_code_image.read())
+        self.assertNotIn('immutable', stale['Cache-Control'])
+        self.assertIn('no-cache', stale['Cache-Control'])
+        self.assertIn('immutable', self.client.get(registration.qr_code_url)['Cache-Control'])
+
+
+class RelocateQRCodesTests(TestCase):
+    """--prune only deletes unreferenced files older than the grace period"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def stray_file(self, name, age_minutes):
+        path = os.path.join(self.directory, 'qr_codes', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'png')
+        modified = datetime.datetime.now().timestamp() - age_minutes * 60
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_recent_unreferenced_files_are_kept(self):
+        old = self.stray_file('old.png', 120)
+        recent = self.stray_file('ab/cd/recent.png', 5)
+        out = StringIO()
+        call_command('relocate_qr_codes', '--prune', '--prune-grace', '60', stdout=out)
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+        self.assertIn('Pruned 1 unreferenced QR file(s); kept 1', out.getvalue())
+
+
+@override_settings(QR_GENERATION_MODE='deferred', EMAIL_DELIVERY_MODE='outbox')
+class RegistrationFormTests(TestCase):
+    """Registration forms come from the compiled schema and are saved with a bounded number of queries"""
+
+    def setUp(self):
+        cache.clear()
+        today = datetime.date.today()
+        self.organizer = User.objects.create_user('organizer', password='password')
+        self.event = Event.objects.create(
+            organizer=self.organizer, name='Conference', start_date=today, end_date=today,
+            start_time=datetime.time(9), end_time=datetime.time(17), location='Hall', is_published=True,
+        )
+        self.url = reverse('events:event_register', kwargs={'slug': self.event.slug})
+
+    def add_field(self, name, field_type='text', **flags):
+        return EventField.objects.create(event=self.event, field_name=name, field_type=field_type,
+                                         order=EventField.objects.filter(event=self.event).count(), **flags)
+
+    def test_editing_a_field_moves_the_form_to_a_new_schema(self):
+        field = self.add_field('Name', is_participant_name=True)
+        self.assertContains(self.client.get(self.url), 'Name')
+
+        self.client.force_login(self.organizer)
+        response = self.client.post(reverse('events:edit_field', kwargs={'slug': self.event.slug, 'field_id': field.pk}), {
+            'field_name': 'Full name', 'field_type': 'text', 'is_required': 'on', 'order': 0,
+            'is_participant_name': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Full name')
+        self.assertEqual(response.context['form'].fields[f'field_{field.pk}'].label, 'Full name')
+
+    def register(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_save_writes_field_data_with_a_bounded_number_of_queries(self):
+        name = self.add_field('Name', is_participant_name=True)
+        email = self.add_field('Email', 'email', is_participant_email=True)
+        topics = self.add_field('Topics', 'checkbox', choices='Python\nDjango')
+        # Compile and cache the schema, as any earlier request would have
+        self.client.get(self.url)
+        few = self.register({f'field_{name.pk}': 'Ada', f'field_{email.pk}': 'ada@example.com',
+                             f'field_{topics.pk}': ['Python', 'Django']})
+
+        registration = Registration.objects.get(participant_name='Ada')
+        self.assertEqual(registration.participant_email, 'ada@example.com')
+        self.assertEqual(
+            dict(registration.field_data.values_list('event_field_id', 'field_value')),
+            {name.pk: 'Ada', email.pk: 'ada@example.com', topics.pk: '["Python", "Django"]'},
+        )
+
+        extra = [self.add_field(f'Question {i}') for i in range(5)]
+        self.client.get(self.url)
+        many = self.register({f'field_{name.pk}': 'Grace', f'field_{email.pk}': 'grace@example.com',
+                              f'field_{topics.pk}': ['Django'], **{f'field_{field.pk}': 'Yes' for field in extra}})
+        self.assertEqual(many, few)
+        self.assertEqual(Registration.objects.get(participant_name='Grace').field_data.count(), 8)
+
+
+class FlakyConnection:
+    """Email backend stand-in that refuses chosen recipients"""
+
+    def __init__(self, opened, errors):
+        self.opened = opened
+        self.errors = errors
+
+    def open(self):
+        self.opened.append(self)
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        error = self.errors.get(messages[0].to[0])
+        if error:
+            raise error
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+@override_settings(EMAIL_DELIVERY_MODE='outbox', EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def test_batch_reuses_one_connection_and_retries_temporary_failures(self):
+        for name in ('ok', 'busy', 'bad', 'ok2'):
+            queue_email(f'{name}@example.com', 'Subject', 'Body')
+        self.assertEqual(mail.outbox, [])
+
+        opened = []
+        errors = {
+            'busy@example.com': smtplib.SMTPDataError(451, 'Try again later'),
+            'bad@example.com': smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')}),
+        }
+        sender = OutboxSender(connection_factory=lambda **kwargs: FlakyConnection(opened, errors), max_per_minute=0)
+        self.assertEqual(sender.send(claim(10)), (2, 1, 1))
+        # A temporary failure drops the connection, so the last email used a second one
+        self.assertEqual(len(opened), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ok2@example.com', 'ok@example.com'])
+
+        busy = OutgoingEmail.objects.get(recipient='busy@example.com')
+        self.assertEqual((busy.status, busy.attempts), ('pending', 1))
+        self.assertGreater(busy.next_attempt_at, datetime.datetime.now(datetime.timezone.utc))
+        self.assertEqual(OutgoingEmail.objects.get(recipient='bad@example.com').status, 'failed')
+        # Not due yet
+        self.assertEqual(claim(10), [])
+
+        OutgoingEmail.objects.filter(pk=busy.pk).update(attempts=2, next_attempt_at=busy.created_at)
+        self.assertEqual(sender.send(claim(10)), (0, 0, 1))
+        self.assertEqual(OutgoingEmail.objects.get(pk=busy.pk).status, 'failed')
+
+    def test_rate_limited_batch_is_sent_within_the_claim_lease(self):
+        # 20 per minute over half of the 5 minute lease
+        self.assertEqual(OutboxSender(max_per_minute=20).batch_limit(500), 50)
+        self.assertEqual(OutboxSender(max_per_minute=20).batch_limit(10), 10)
+        self.assertEqual(OutboxSender(max_per_minute=0).batch_limit(500), 500)
+
+
+@override_settings(QR_GENERATION_MODE='deferred', REGISTRATION_INTAKE_MODE='spool', EMAIL_DELIVERY_MODE='outbox')
+class RegistrationSpoolTests(TestCase):
+    """drain_registration_spool writes spooled submissions once and sets aside the ones it can't write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date.today()
+        organizer = User.objects.create_user('organizer', password='password')
+        cls.event = Event.objects.create(
+            organizer=organizer, name='Conference', start_date=today, end_date=today,
+            start_time=datetime.time(9), end_time=datetime.time(17), location='Hall', is_published=True,
+        )
+        cls.field = EventField.objects.create(event=cls.event, field_name='Name', field_type='text',
+                                              is_participant_name=True)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # The success page renders the QR image into MEDIA_ROOT
+        settings = override_settings(REGISTRATION_SPOOL_PATH=os.path.join(directory, 'spool.sqlite3'),
+                                     MEDIA_ROOT=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def submit(self, name, email=''):
+        return spool.append(self.event.pk, {
+            'values': {str(self.field.pk): name},
+            'participant': {'participant_name': name, 'participant_email': email, 'participant_phone': ''},
+        })
+
+    def drain(self, *args):
+        call_command('drain_registration_spool', *args, stdout=StringIO())
+
+    def test_submissions_are_written_with_their_field_data(self):
+        reference = self.submit('Ada')
+        self.drain()
+
+        registration = Registration.objects.get(unique_id=reference)
+        self.assertEqual(registration.participant_name, 'Ada')
+        self.assertEqual(registration.field_data.get().field_value, 'Ada')
+        self.assertIsNone(spool.state(reference))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.registration_count, 1)
+
+    def test_submission_written_by_a_crashed_run_is_not_duplicated(self):
+        reference = self.submit('Ada')
+        # The earlier run committed the registration but died before clearing the spool
+        Registration.objects.create(event=self.event, unique_id=reference, participant_name='Ada')
+        self.drain()
+
+        self.assertEqual(Registration.objects.filter(participant_name='Ada').count(), 1)
+        self.assertIsNone(spool.state(reference))
+
+    def test_database_error_fails_only_that_submission(self):
+        bad = self.submit('x' * 300)
+        good = self.submit('Grace')
+        save = Registration.save
+
+        def strict_save(registration, *args, **kwargs):
+            if len(registration.participant_name) > 200:
+                raise DataError('value too long for type character varying(200)')
+            return save(registration, *args, **kwargs)
+
+        with mock.patch.object(Registration, 'save', strict_save):
+            self.drain()
+
+        self.assertTrue(Registration.objects.filter(unique_id=good).exists())
+        self.assertEqual(spool.state(bad)[0], 'failed')
+        self.assertIn('value too long', spool.state(bad)[1])
+
+    def test_submission_that_keeps_breaking_its_batch_is_failed(self):
+        reference = self.submit('Ada')
+        with mock.patch.object(RegistrationFormFieldData.objects, 'bulk_create',
+                               side_effect=RuntimeError('database went away')):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    self.drain('--max-attempts', '2')
+        self.assertEqual(spool.state(reference)[0], 'pending')
+
+        self.drain('--max-attempts', '2')
+        self.assertEqual(spool.state(reference), ('failed', 'Gave up after 2 attempts'))
+        self.assertFalse(Registration.objects.filter(unique_id=reference).exists())
+
+    def test_confirmation_is_queued_in_the_registration_transaction(self):
+        reference = self.submit('Ada', 'ada@example.com')
+        with mock.patch.object(RegistrationFormFieldData.objects, 'bulk_create',
+                               side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                self.drain()
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+        self.drain()
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(str(email.registration.unique_id), reference)
+        self.assertEqual(email.recipient, 'ada@example.com')
+
+    def test_status_rechecks_a_registration_written_during_the_request(self):
+        reference = self.submit('Ada')
+        url = reverse('events:registration_status', kwargs={'unique_id': reference})
+        self.assertEqual(self.client.get(url).json(), {'status': 'pending'})
+
+        state = spool.state
+
+        def drained_meanwhile(unique_id):
+            self.drain()
+            return state(unique_id)
+
+        with mock.patch.object(spool, 'state', drained_meanwhile):
+            self.assertEqual(self.client.get(url).json(), {'status': 'confirmed'})
+            response = self.client.get(reverse('events:registration_success', kwargs={'unique_id': reference}))
+        self.assertTemplateUsed(response, 'events/registration_success.html')
@@ -22,7 +22,9 @@ urlpatterns = [
     # Public registration URLs
     path('<slug:slug>/register/', views.EventRegistrationView.as_view(), name='event_register'),
     path('registration/<uuid:unique_id>/success/', views.RegistrationSuccessView.as_view(), name='registration_success'),
+    path('registration/<uuid:unique_id>/status/', views.RegistrationStatusView.as_view(), name='registration_status'),
     path('registration/<uuid:unique_id>/qr/', views.QRCodeView.as_view(), name='qr_code'),
+    path('registration/<uuid:unique_id>/qr.png', views.RegistrationQRImageView.as_view(), name='qr_image'),
       # Participant management
     path('<int:pk>/participants/', views.ParticipantListView.as_view(), name='participant_list'),
     path('<int:pk>/participants/export/', views.ExportParticipantsView.as_view(), name='export_participants'),
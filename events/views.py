@@ -4,17 +4,41 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.views import View
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
-from django.http import HttpResponse
-from django.core.mail import send_mail
-from django.conf import settings
+from django.http import HttpResponse, Http404, JsonResponse
+from django.db import transaction
 from django.db.models import Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from urllib.parse import quote
 import csv
-from io import BytesIO
-import qrcode
+import hashlib
 
 from .models import Event, EventField, Registration
 from .forms import EventForm, EventFieldForm, DynamicRegistrationForm
+from .emails import queue_registration_confirmation
+from .intake import FAILED, enqueue, spool, spool_enabled
+from .qr_cache import event_qr_etag, get_event_qr_png, get_registration_qr_png
+
+# QR images never change for a given URL/ETag, so browsers may keep them for a year
+QR_IMAGE_MAX_AGE = 60 * 60 * 24 * 365
+
+def registration_page_etag(request, **lookup):
+    """ETag for registration QR pages from one narrow query over everything the page shows"""
+    row = Registration.objects.filter(**lookup).values_list(
+        'unique_id', 'status', 'attended_at', 'participant_name', 'qr_code_image', 'event__updated_at'
+    ).first()
+    if row is None:
+        return None
+    return hashlib.sha1(repr((row, request.user.pk)).encode('utf-8')).hexdigest()
+
+def qr_code_page_etag(request, unique_id):
+    return registration_page_etag(request, unique_id=unique_id)
+
+def registration_qr_page_etag(request, pk):
+    return registration_page_etag(request, pk=pk)
 
 class EventListView(LoginRequiredMixin, ListView):
     model = Event
@@ -134,11 +158,16 @@ class EventRegistrationView(View):
         event = get_object_or_404(Event, slug=slug, is_published=True)
         form = DynamicRegistrationForm(event, request.POST, request.FILES)
         
+        if form.is_valid() and spool_enabled():
+            # Surge intake: acknowledge now, drain_registration_spool writes the registration
+            return redirect('events:registration_success', unique_id=enqueue(form))
+        
         if form.is_valid():
-            registration = form.save()
-              # Send email with QR code (optional)
-            if registration.participant_email:
-                self.send_confirmation_email(registration)
+            # The confirmation is queued in the registration's transaction: both rows or neither
+            with transaction.atomic():
+                registration = form.save()
+                if registration.participant_email:
+                    self.send_confirmation_email(registration)
             
             return redirect('events:registration_success', unique_id=registration.unique_id)
         
@@ -148,54 +177,40 @@ class EventRegistrationView(View):
         })
 
     def send_confirmation_email(self, registration):
-        try:
-            subject = f'Registration Confirmation - {registration.event.name}'
-            message = f'''
-            Dear {registration.participant_name},
-            
-            Thank you for registering for {registration.event.name}!
-            
-            Event Details:
-            - Date: {registration.event.start_date}
-            - Time: {registration.event.start_time}
-            - Location: {registration.event.location}
-            
-            Your QR Code: {self.request.build_absolute_uri(reverse('events:qr_code', kwargs={'unique_id': registration.unique_id}))}
-            
-            Please bring this QR code to the event for check-in.
-            
-            Best regards,
-            {registration.event.organizer.get_full_name() or registration.event.organizer.username}
-            '''
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [registration.participant_email],
-                fail_silently=True,
-            )
-            
-            # Log email sending in development mode
-            if settings.EMAIL_BACKEND == 'django.core.mail.backends.console.EmailBackend':
-                print(f"[DEVELOPMENT MODE] Confirmation email logged to console for: {registration.participant_email}")
-            else:
-                print(f"Confirmation email sent to: {registration.participant_email}")
-                
-        except Exception as e:
-            print(f"Email sending failed: {e}")
+        qr_code_url = self.request.build_absolute_uri(
+            reverse('events:qr_code', kwargs={'unique_id': registration.unique_id})
+        )
+        queue_registration_confirmation(registration, qr_code_url)
 
 class RegistrationSuccessView(DetailView):
     model = Registration
     template_name = 'events/registration_success.html'
     context_object_name = 'registration'
 
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            state = spool.state(self.kwargs['unique_id']) if spool_enabled() else None
+            if state is None:
+                # Not spooled, or written and cleared from the spool since the lookup above
+                return super().get(request, *args, **kwargs)
+        # Still spooled: show a page that polls until the registration is written
+        return render(request, 'events/registration_pending.html', {
+            'reference': self.kwargs['unique_id'],
+            'failed': state[0] == FAILED,
+            'status_url': reverse('events:registration_status', kwargs={'unique_id': self.kwargs['unique_id']}),
+        })
+
     def get_object(self):
-        return get_object_or_404(Registration, unique_id=self.kwargs['unique_id'])
+        registration = get_object_or_404(Registration, unique_id=self.kwargs['unique_id'])
+        # Deferred QR generation: render on demand if the worker hasn't caught up yet
+        registration.ensure_qr_code()
+        return registration
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        registration = self.get_object()
+        registration = self.object
         
         # Generate QR code URL
         qr_code_url = self.request.build_absolute_uri(
@@ -209,13 +224,58 @@ class RegistrationSuccessView(DetailView):
         
         return context
 
+@method_decorator(cache_control(no_store=True), name='get')
+class RegistrationStatusView(View):
+    """Whether a spooled registration has been written yet; polled by the pending success page"""
+
+    def get(self, request, unique_id):
+        if Registration.objects.filter(unique_id=unique_id).exists():
+            return JsonResponse({'status': 'confirmed'})
+        state = spool.state(unique_id) if spool_enabled() else None
+        if state is None:
+            # The drain may have written it and cleared the spool since the check above
+            if Registration.objects.filter(unique_id=unique_id).exists():
+                return JsonResponse({'status': 'confirmed'})
+            return JsonResponse({'status': 'unknown'}, status=404)
+        return JsonResponse({'status': state[0]})
+
+@method_decorator([vary_on_cookie, cache_control(private=True, no_cache=True), condition(etag_func=qr_code_page_etag)], name='get')
 class QRCodeView(DetailView):
     model = Registration
     template_name = 'events/qr_code.html'
     context_object_name = 'registration'
 
     def get_object(self):
-        return get_object_or_404(Registration, unique_id=self.kwargs['unique_id'])
+        registration = get_object_or_404(Registration, unique_id=self.kwargs['unique_id'])
+        registration.ensure_qr_code()
+        return registration
+
+class RegistrationQRImageView(View):
+    """Serve a registration QR image from the QR cache instead of inlining it as base64
+
+    Pages link to ``?v=<digest>`` of the stored image. Only a response whose
+    bytes match that digest is cached as immutable; any other request gets
+    the current image, revalidated against its ETag.
+    """
+
+    def get(self, request, unique_id):
+        version = request.GET.get('v')
+        try:
+            # A versioned URL whose image is cached is answered without DB or Pillow work
+            data, digest = get_registration_qr_png(unique_id, version)
+        except Registration.DoesNotExist:
+            raise Http404('Registration not found')
+
+        etag = '"%s"' % digest
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(data, content_type='image/png')
+        response['ETag'] = etag
+        if version == digest:
+            patch_cache_control(response, public=True, max_age=QR_IMAGE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
 
 class ParticipantListView(LoginRequiredMixin, DetailView):
     model = Event
@@ -375,22 +435,18 @@ class PublishEventView(LoginRequiredMixin, View):
 
 class EventQRCodeView(LoginRequiredMixin, View):
     def get(self, request, pk):
-        event = get_object_or_404(Event, pk=pk, organizer=request.user)
-        
-        response = HttpResponse(content_type='image/png')
-        response['Content-Disposition'] = f'attachment; filename="{event.slug}_qr_code.png"'
-        
-        # Generate QR code image
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(request.build_absolute_uri(event.registration_url))
-        qr.make(fit=True)
+        event = get_object_or_404(Event.objects.only('id', 'slug'), pk=pk, organizer=request.user)
+        etag = event_qr_etag(event.slug)
         
-        img = qr.make_image(fill_color="black", back_color="white")
-        img_io = BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content_type='image/png')
+            response['Content-Disposition'] = f'attachment; filename="{event.slug}_qr_code.png"'
+            response.write(get_event_qr_png(event))
         
-        response.write(img_io.getvalue())
+        # The URL is keyed by pk while the content follows the slug, so keep it private and revalidate daily
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=60 * 60 * 24)
         return response
 
 class RegistrationDetailView(LoginRequiredMixin, DetailView):
@@ -401,6 +457,7 @@ class RegistrationDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Registration.objects.filter(event__organizer=self.request.user)
 
+@method_decorator([vary_on_cookie, cache_control(private=True, no_cache=True), condition(etag_func=registration_qr_page_etag)], name='get')
 class RegistrationQRCodeView(DetailView):
     model = Registration
     template_name = 'events/registration_qr.html'
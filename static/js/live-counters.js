@@ -0,0 +1,84 @@
+// Live attendance counters over server-sent events from /checkin/<event>/live/.
+// Elements marked data-live-counter="registered|attended|pending|cancelled|rate"
+// are kept current from counter snapshots and deltas; options.onCheckIn is
+// called with each recent check-in ({registration_id, participant_name, attended_at}).
+// connect() returns an object whose checkedIn() applies this page's own check-ins
+// right away; the same check-in arriving later over the stream is not counted twice.
+const LiveCounters = (function() {
+    function render(counters) {
+        document.querySelectorAll('[data-live-counter]').forEach(function(el) {
+            const key = el.dataset.liveCounter;
+            if (key === 'rate') {
+                const rate = counters.registered > 0 ? Math.round(counters.attended * 100 / counters.registered) : 0;
+                el.textContent = rate + '%';
+            } else if (key in counters) {
+                el.textContent = counters[key];
+            }
+        });
+    }
+
+    function connect(url, options) {
+        options = options || {};
+        let counters = null;
+        const counted = new Set();
+
+        function applyDelta(delta) {
+            if (!counters) {
+                return;
+            }
+            Object.keys(delta).forEach(function(key) {
+                counters[key] = (counters[key] || 0) + delta[key];
+            });
+            render(counters);
+        }
+
+        function notify(checkIns) {
+            if (options.onCheckIn) {
+                checkIns.forEach(options.onCheckIn);
+            }
+        }
+
+        function count(checkIns) {
+            const delta = {};
+            checkIns.forEach(function(checkIn) {
+                if (counted.has(checkIn.registration_id)) {
+                    return;
+                }
+                counted.add(checkIn.registration_id);
+                delta.attended = (delta.attended || 0) + 1;
+                delta[checkIn.previous_status] = (delta[checkIn.previous_status] || 0) - 1;
+            });
+            applyDelta(delta);
+        }
+
+        const source = window.EventSource ? new EventSource(url) : null;
+        if (source) {
+            source.addEventListener('counters', function(e) {
+                // Snapshots already include every check-in committed so far
+                counters = JSON.parse(e.data);
+                render(counters);
+            });
+            source.addEventListener('registration', function(e) {
+                applyDelta(JSON.parse(e.data).delta);
+            });
+            source.addEventListener('checkin', function(e) {
+                const message = JSON.parse(e.data);
+                count(message.check_ins);
+                notify(message.check_ins);
+            });
+            source.addEventListener('recent', function(e) {
+                notify(JSON.parse(e.data).check_ins);
+            });
+        }
+
+        return {
+            source: source,
+            checkedIn: function(checkIn) {
+                count([checkIn]);
+                notify([checkIn]);
+            }
+        };
+    }
+
+    return { connect: connect };
+})();
@@ -0,0 +1,205 @@
+// Offline check-in support shared by the scanner page and the service worker.
+// Rosters downloaded from /checkin/<event>/roster/ live in IndexedDB so scans can
+// be validated locally; check-ins made offline are queued and replayed through
+// the batch check-in API once the network is back.
+const OfflineCheckin = (function() {
+    const DB_NAME = 'checkin-offline';
+    const DB_VERSION = 1;
+    const BATCH_LIMIT = 500;
+    // Bumped when roster entries gain fields, so the next sync downloads a full roster
+    const ROSTER_FORMAT = 2;
+
+    function openDb() {
+        return new Promise(function(resolve, reject) {
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = function() {
+                const db = request.result;
+                const roster = db.createObjectStore('roster', { keyPath: 'unique_id' });
+                roster.createIndex('event_id', 'event_id');
+                roster.createIndex('registration_id', 'registration_id');
+                db.createObjectStore('meta', { keyPath: 'key' });
+                db.createObjectStore('queue', { keyPath: 'id', autoIncrement: true });
+            };
+            request.onsuccess = function() { resolve(request.result); };
+            request.onerror = function() { reject(request.error); };
+        });
+    }
+
+    function promisify(request) {
+        return new Promise(function(resolve, reject) {
+            request.onsuccess = function() { resolve(request.result); };
+            request.onerror = function() { reject(request.error); };
+        });
+    }
+
+    function transactionDone(tx) {
+        return new Promise(function(resolve, reject) {
+            tx.oncomplete = function() { resolve(); };
+            tx.onerror = function() { reject(tx.error); };
+            tx.onabort = function() { reject(tx.error); };
+        });
+    }
+
+    async function getMeta(key) {
+        const db = await openDb();
+        const row = await promisify(db.transaction('meta').objectStore('meta').get(key));
+        return row ? row.value : null;
+    }
+
+    // Download a full roster the first time, then only deltas since the stored version
+    async function syncRoster(eventId, rosterUrl) {
+        const version = await getMeta('version:' + ROSTER_FORMAT + ':' + eventId);
+        const url = version ? rosterUrl + '?since=' + encodeURIComponent(version) : rosterUrl;
+        const response = await fetch(url, { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error('Roster download failed: ' + response.status);
+        }
+        const snapshot = await response.json();
+
+        const db = await openDb();
+        const tx = db.transaction(['roster', 'meta'], 'readwrite');
+        const roster = tx.objectStore('roster');
+        if (snapshot.full) {
+            const index = roster.index('event_id');
+            const keys = await promisify(index.getAllKeys(IDBKeyRange.only(snapshot.event_id)));
+            keys.forEach(function(key) { roster.delete(key); });
+        }
+        snapshot.entries.forEach(function(entry) {
+            const row = { event_id: snapshot.event_id };
+            snapshot.fields.forEach(function(field, i) { row[field] = entry[i]; });
+            roster.put(row);
+        });
+        tx.objectStore('meta').put({ key: 'version:' + ROSTER_FORMAT + ':' + eventId, value: snapshot.version });
+        await transactionDone(tx);
+        return snapshot.entries.length;
+    }
+
+    // Resolve a scanned payload (bare UUID or signed R1 token) against the local roster.
+    // Signed tokens must carry the signature the roster holds for that registration,
+    // so a token made up from a guessed registration id is rejected offline too.
+    async function lookup(eventId, qrText) {
+        const db = await openDb();
+        const store = db.transaction('roster').objectStore('roster');
+        const text = (qrText || '').trim();
+        let row;
+        if (text.toUpperCase().startsWith('R1.')) {
+            const parts = text.toUpperCase().split('.');
+            if (parts.length !== 4 || parseInt(parts[1], 36) !== eventId) {
+                return null;
+            }
+            row = await promisify(store.index('registration_id').get(parseInt(parts[2], 36)));
+            if (row && (!row.signature || row.signature !== parts[3])) {
+                return null;
+            }
+        } else {
+            row = await promisify(store.get(text.toLowerCase()));
+        }
+        return row && row.event_id === eventId ? row : null;
+    }
+
+    async function getByRegistrationId(eventId, registrationId) {
+        const db = await openDb();
+        const index = db.transaction('roster').objectStore('roster').index('registration_id');
+        const row = await promisify(index.get(registrationId));
+        return row && row.event_id === eventId ? row : null;
+    }
+
+    async function countRoster(eventId) {
+        const db = await openDb();
+        const index = db.transaction('roster').objectStore('roster').index('event_id');
+        return promisify(index.count(IDBKeyRange.only(eventId)));
+    }
+
+    async function countQueued() {
+        const db = await openDb();
+        return promisify(db.transaction('queue').objectStore('queue').count());
+    }
+
+    // Queue a check-in for later replay and mark it attended locally right away;
+    // source ({gate, device}) is replayed with the scan for the server's scan ledger.
+    // Scanned check-ins keep the raw QR text so the server verifies it again on sync.
+    async function queueCheckin(eventId, entry, batchUrl, csrfToken, source, qrCode) {
+        const scannedAt = new Date().toISOString();
+        const db = await openDb();
+        const tx = db.transaction(['queue', 'roster', 'meta'], 'readwrite');
+        tx.objectStore('queue').add(Object.assign({
+            event_id: eventId,
+            registration_id: entry.registration_id,
+            qr_code: qrCode || null,
+            scanned_at: scannedAt
+        }, source || {}));
+        entry.status = 'attended';
+        entry.attended_at = scannedAt;
+        tx.objectStore('roster').put(entry);
+        tx.objectStore('meta').put({ key: 'batch_url', value: batchUrl });
+        tx.objectStore('meta').put({ key: 'csrftoken', value: csrfToken });
+        await transactionDone(tx);
+        return scannedAt;
+    }
+
+    // Replay queued check-ins through the batch API; items are removed once the server answered
+    async function flushQueue() {
+        const batchUrl = await getMeta('batch_url');
+        const csrfToken = await getMeta('csrftoken');
+        if (!batchUrl) {
+            return 0;
+        }
+
+        const db = await openDb();
+        const queued = await promisify(db.transaction('queue').objectStore('queue').getAll());
+        let sent = 0;
+        const byEvent = {};
+        queued.forEach(function(item) {
+            (byEvent[item.event_id] = byEvent[item.event_id] || []).push(item);
+        });
+
+        for (const eventId of Object.keys(byEvent)) {
+            const items = byEvent[eventId];
+            for (let start = 0; start < items.length; start += BATCH_LIMIT) {
+                const chunk = items.slice(start, start + BATCH_LIMIT);
+                const headers = {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfToken
+                };
+                // Queue ids are stable until the server answers, so a resent chunk replays its first result
+                if (chunk[0].device) {
+                    headers['Idempotency-Key'] = ['queue', chunk[0].device, chunk[0].id, chunk[chunk.length - 1].id, chunk.length].join('-');
+                }
+                const response = await fetch(batchUrl, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: headers,
+                    body: JSON.stringify({
+                        event_id: Number(eventId),
+                        scans: chunk.map(function(item) {
+                            const scan = item.qr_code ? { qr_code: item.qr_code } : { registration_id: item.registration_id };
+                            return Object.assign(scan, {
+                                scanned_at: item.scanned_at,
+                                gate: item.gate || '',
+                                device: item.device || ''
+                            });
+                        })
+                    })
+                });
+                if (!response.ok) {
+                    throw new Error('Batch check-in failed: ' + response.status);
+                }
+                const tx = db.transaction('queue', 'readwrite');
+                chunk.forEach(function(item) { tx.objectStore('queue').delete(item.id); });
+                await transactionDone(tx);
+                sent += chunk.length;
+            }
+        }
+        return sent;
+    }
+
+    return {
+        syncRoster: syncRoster,
+        lookup: lookup,
+        getByRegistrationId: getByRegistrationId,
+        countRoster: countRoster,
+        countQueued: countQueued,
+        queueCheckin: queueCheckin,
+        flushQueue: flushQueue
+    };
+})();
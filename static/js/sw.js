@@ -1,10 +1,13 @@
 // Service Worker for Event Registration App
-const CACHE_NAME = 'event-registration-v1';
+importScripts('/static/js/offline-checkin.js');
+
+const CACHE_NAME = 'event-registration-v5';
 const urlsToCache = [
     '/',
     '/static/css/bootstrap.min.css',
     '/static/js/bootstrap.bundle.min.js',
     '/static/js/qr-scanner-enhanced.js',
+    '/static/js/offline-checkin.js',
     'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
     'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js'
 ];
@@ -22,6 +25,12 @@ self.addEventListener('install', function(event) {
 
 // Fetch event
 self.addEventListener('fetch', function(event) {
+    // Never serve check-in APIs, rosters or other writes from the static cache
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.pathname.startsWith('/checkin/')) {
+        return;
+    }
+
     event.respondWith(
         caches.match(event.request)
             .then(function(response) {
@@ -67,3 +76,27 @@ self.addEventListener('activate', function(event) {
         })
     );
 });
+
+// Roster download requested by the scanner page
+self.addEventListener('message', function(event) {
+    const data = event.data || {};
+    if (data.type !== 'sync-roster') {
+        return;
+    }
+    event.waitUntil(
+        OfflineCheckin.syncRoster(data.eventId, data.rosterUrl)
+            .then(function(count) {
+                event.source.postMessage({ type: 'roster-synced', eventId: data.eventId, changed: count });
+            })
+            .catch(function(error) {
+                event.source.postMessage({ type: 'roster-sync-failed', eventId: data.eventId, error: String(error) });
+            })
+    );
+});
+
+// Background Sync: replay check-ins queued while offline
+self.addEventListener('sync', function(event) {
+    if (event.tag === 'checkin-queue') {
+        event.waitUntil(OfflineCheckin.flushQueue());
+    }
+});